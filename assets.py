@@ -0,0 +1,200 @@
+"""
+이미지/영상 에셋의 경량 버전(표시 크기로 줄인 이미지, 가벼운 인트로 영상)을 만들고 찾아주는 모듈.
+
+- st.image / st.chat_message(avatar=...)는 파일을 읽어서 JPEG(투명 부분이 있으면 PNG)로 보내고,
+  포맷이 다르거나 표시 크기보다 크면 quality 90으로 다시 인코딩합니다.
+  그래서 경량 버전도 Streamlit이 실제로 보내는 포맷으로, 표시 크기에 맞춰 저장합니다. (그대로 전송됨)
+- 원본을 보낼 때(다시 인코딩된 크기 포함)보다 작을 때만 경량 버전을 씁니다.
+- 변환 결과는 .asset_cache/ 폴더에 저장되며, 파일 이름에 원본 내용의 해시가 들어가므로
+  원본이 바뀌면 자동으로 새로 만들어집니다.
+- Pillow(이미지)나 ffmpeg(영상)가 없으면 변환을 건너뛰고 원본 경로를 그대로 돌려줍니다.
+- 변환은 느리므로 image_variant()는 이미 만들어진 결과만 찾고, 만드는 건 build_image_variant()가 합니다.
+  배포 전에 미리 만들어 두려면:  python assets.py
+"""
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import threading
+
+try:
+    from PIL import Image
+except ImportError: # Pillow가 없으면 원본 이미지를 그대로 사용
+    Image = None
+
+ASSET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".asset_cache")
+
+# 아바타/본문 이미지는 Streamlit이 크기를 줄이지 않으므로 표시 크기의 약 2배(고해상도 화면 대응)로,
+# 헤더는 st.image(width=80)가 어차피 80px로 줄여서 다시 인코딩하므로 80px로 만듭니다.
+AVATAR_WIDTH = 96    # 채팅 말풍선 아바타
+HEADER_WIDTH = 80    # 상단 헤더의 야엘 이미지 (width=80으로 표시)
+CONTENT_WIDTH = 960  # 채팅 영역 안에 꽉 차게 표시되는 이미지 (메뉴판 등)
+
+JPEG_QUALITY = 82          # 경량 버전의 JPEG 품질
+STREAMLIT_JPEG_QUALITY = 90 # Streamlit이 이미지를 다시 인코딩할 때 쓰는 품질
+MAX_SENT_WIDTH = 1460       # 아바타 / use_container_width 이미지를 Streamlit이 줄이는 최대 폭
+
+# python assets.py 로 미리 만들어 둘 목록: (원본 경로, 가로 크기)
+PREBUILD_IMAGES = [
+    ("img/Yael.png", HEADER_WIDTH),
+    ("img/Yael.png", AVATAR_WIDTH),
+    ("img/User.png", AVATAR_WIDTH),
+    ("img/cafe_menu.jpg", CONTENT_WIDTH),
+    ("img/Yael_2.png", CONTENT_WIDTH),
+]
+PREBUILD_VIDEOS = ["img/Yael_intro.mp4"]
+
+INTRO_VIDEO_HEIGHT = 720 # 인트로 영상 경량 버전의 세로 해상도
+
+_hash_cache = {}  # (경로, mtime) -> 원본 해시 (같은 파일을 매번 다시 읽지 않기 위해)
+_build_lock = threading.Lock()
+
+
+def source_hash(path):
+    """원본 파일 내용의 해시 (앞 12자리). 경로+mtime 기준으로 메모리에 캐시합니다."""
+    key = (path, os.path.getmtime(path))
+    if key not in _hash_cache:
+        with open(path, "rb") as f:
+            _hash_cache[key] = hashlib.sha1(f.read()).hexdigest()[:12]
+    return _hash_cache[key]
+
+
+def _cache_path(path, suffix):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(ASSET_CACHE_DIR, f"{stem}-{source_hash(path)}-{suffix}")
+
+
+def _sent_format(img):
+    """Streamlit이 이 이미지를 보낼 때 쓰는 포맷 (투명 부분이 있을 수 있으면 PNG, 아니면 JPEG)"""
+    return "PNG" if img.mode in ("RGBA", "LA", "P") else "JPEG"
+
+
+def _encode(img, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        img.convert("RGB").save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _resized(img, width):
+    if img.width <= width: # 확대는 하지 않음
+        return img
+    return img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+
+
+def _original_sent_size(path, img):
+    """
+    원본을 그대로 넘겼을 때 Streamlit이 보내는 크기.
+    포맷이 맞고 MAX_SENT_WIDTH 이하면 파일 그대로, 아니면 그 폭 이하로 줄여 quality 90으로 다시 인코딩한 크기입니다.
+    """
+    fmt = _sent_format(img)
+    if img.format == fmt and img.width <= MAX_SENT_WIDTH:
+        return os.path.getsize(path)
+    return len(_encode(_resized(img, MAX_SENT_WIDTH), fmt, STREAMLIT_JPEG_QUALITY))
+
+
+def _variant_paths(path, width):
+    """(경량 버전 파일 후보들, '원본이 더 작음' 표시 파일)"""
+    variants = [_cache_path(path, f"w{width}.{ext}") for ext in ("jpg", "png")]
+    return variants, _cache_path(path, f"w{width}.original")
+
+
+def image_variant(path, width):
+    """
+    이미 만들어진 경량 버전의 경로를 돌려줍니다. (파일 확인만 하므로 빠름)
+    원본이 더 작다고 판단된 경우나 변환할 수 없으면 원본 경로를, 아직 만들어지지 않았으면 None을 돌려줍니다.
+    """
+    if Image is None or not os.path.exists(path):
+        return path
+    variants, keep_original = _variant_paths(path, width)
+    for variant in variants:
+        if os.path.exists(variant):
+            return variant
+    if os.path.exists(keep_original):
+        return path
+    return None
+
+
+def build_image_variant(path, width):
+    """
+    가로 width px 이하로 줄여서 Streamlit이 보내는 포맷(JPEG/PNG)으로 저장하고, 쓸 경로를 돌려줍니다.
+    원본을 보낼 때보다 크면 원본을 쓰도록 표시만 남깁니다. 수백 ms 걸릴 수 있으므로 백그라운드에서 호출하세요.
+    """
+    existing = image_variant(path, width)
+    if existing is not None:
+        return existing
+
+    try:
+        with _build_lock:
+            os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+            variants, keep_original = _variant_paths(path, width)
+            with Image.open(path) as img:
+                img.load()
+                fmt = _sent_format(img)
+                data = _encode(_resized(img, width), fmt, JPEG_QUALITY)
+                original_size = _original_sent_size(path, img)
+
+            target = variants[0] if fmt == "JPEG" else variants[1]
+            if len(data) > original_size:
+                target, data = keep_original, b""
+            # 임시 파일에 저장 후 이름 변경 (다른 스레드가 반쯤 쓰인 파일을 읽지 않도록)
+            tmp_path = target + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        return image_variant(path, width)
+    except Exception as e:
+        print(f"이미지 변환 실패 ({path}): {e}")
+        return path
+
+
+def video_variant(path):
+    """
+    해상도와 비트레이트를 낮춘 인트로 영상 경로를 돌려줍니다. (ffmpeg 필요)
+    아직 만들어지지 않았거나 만들 수 없으면 원본 경로를 돌려줍니다. 변환은 build_video_variant()가 합니다.
+    """
+    if not os.path.exists(path):
+        return path
+    target = _cache_path(path, f"{INTRO_VIDEO_HEIGHT}p.mp4")
+    if os.path.exists(target) and os.path.getsize(target) < os.path.getsize(path):
+        return target
+    return path
+
+
+def build_video_variant(path):
+    """ffmpeg로 인트로 영상의 경량 버전을 만듭니다. 몇 초 걸리므로 백그라운드에서 호출하세요."""
+    if shutil.which("ffmpeg") is None or not os.path.exists(path):
+        return path
+
+    target = _cache_path(path, f"{INTRO_VIDEO_HEIGHT}p.mp4")
+    if not os.path.exists(target):
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        tmp_path = target + ".tmp.mp4"
+        command = [
+            "ffmpeg", "-y", "-loglevel", "error", "-i", path,
+            "-vf", f"scale=-2:'min({INTRO_VIDEO_HEIGHT},ih)'",
+            "-c:v", "libx264", "-crf", "30", "-preset", "slow", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-b:a", "64k",
+            "-movflags", "+faststart", # 다운로드가 끝나기 전에 재생 시작
+            tmp_path,
+        ]
+        try:
+            subprocess.run(command, check=True, timeout=300)
+            os.replace(tmp_path, target)
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"영상 변환 실패 ({path}): {e}")
+            return path
+
+    return video_variant(path)
+
+
+if __name__ == "__main__":
+    # 배포 전에 모든 경량 버전을 미리 만들어 둡니다.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    for image_path, image_width in PREBUILD_IMAGES:
+        print(f"{image_path} (w{image_width}) -> {build_image_variant(image_path, image_width)}")
+    for video_path in PREBUILD_VIDEOS:
+        print(f"{video_path} -> {build_video_variant(video_path)}")
@@ -0,0 +1,204 @@
+"""
+콜드 스타트 벤치마크: import 시간과 인트로 화면 / 첫 채팅 화면이 그려지기까지 걸리는 시간.
+
+측정은 매번 새 파이썬 프로세스에서 합니다. (이미 import된 모듈이나 cache_resource가 없는 상태)
+- imports: 인트로 화면에 필요한 모듈(streamlit, dotenv, 앱의 보조 모듈)과
+  채팅 화면에서야 불러오는 Google SDK(google.generativeai, google.api_core)의 import 시간
+- paint: AppTest로 인트로 화면 첫 실행 시간, 이어서 "시작하기"를 누른 뒤 첫 채팅 화면 실행 시간
+  (기본은 가짜 백엔드 fake_genai 사용, --backend real 이면 설치된 SDK 사용)
+- first turn: 첫 메시지의 첫 토큰까지 걸린 시간(TTFT). 가짜 백엔드에서만 측정합니다.
+  warm: 인트로를 --intro-seconds초 동안 보고 들어간 경우 (인트로 동안 모델 준비 + 연결을 미리 해 둠)
+  cold: 인트로 없이 바로 채팅 화면으로 들어간 경우 (워밍업 전과 같음: 첫 메시지가 연결까지 기다림)
+  프로세스의 첫 API 호출은 --connect-delay초(클라이언트 생성 + 연결/인증 가정)가 더 걸립니다.
+  chat page: 그 직전에 들어간 채팅 화면의 실행 시간 (워밍업을 기다리느라 화면이 늦게 뜨지 않는지)
+
+결과는 bench/results/cold_start-<시각>.json 에 저장되고 직전 결과와 비교합니다.
+
+    python bench/cold_start.py --repeat 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+from run_bench import APP_PATH, REPO_DIR, load_previous, percentile, print_report, read_turn_log, save_result
+
+# 인트로 화면에 필요한 모듈 / 채팅 화면에서 처음 불러오는 모듈
+APP_MODULES = ["streamlit", "dotenv", "assets", "conversation_store", "metrics", "model_pool", "response_cache", "scheduler",
+               "token_budget"]
+SDK_MODULES = ["google.generativeai", "google.api_core.exceptions"]
+
+COMPARED_METRICS = [
+    ("app_import_seconds", "app imports (s)", True),
+    ("sdk_import_seconds", "SDK imports (s)", True),
+    ("intro_paint_seconds", "intro first paint (s)", True),
+    ("chat_paint_seconds", "first chat page (s)", True),
+    ("first_turn_chat_paint_warm", "chat page after intro (s)", True),
+    ("first_turn_ttft_warm", "first turn TTFT, intro (s)", True),
+    ("first_turn_ttft_cold", "first turn TTFT, no intro (s)", True),
+]
+
+
+def measure_imports():
+    """모듈별 import 시간 (앞의 모듈이 불러온 의존성은 뒤 모듈에 포함되지 않음)"""
+    sys.path.insert(0, REPO_DIR)
+    timings = {}
+    for name in APP_MODULES + SDK_MODULES:
+        started = time.perf_counter()
+        try:
+            __import__(name)
+        except ImportError:
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def prepare_app():
+    """앱의 저장소/로그를 임시 폴더로 돌리고 턴별 측정 로그 경로를 돌려줍니다."""
+    workdir = tempfile.mkdtemp(prefix="yael-cold-start-")
+    turn_log_path = os.path.join(workdir, "turns.jsonl")
+    os.environ.update({
+        "CONVERSATION_STORE_PATH": os.path.join(workdir, "conversations.sqlite3"),
+        "METRICS_LOG_PATH": turn_log_path,
+    })
+    os.chdir(REPO_DIR)
+    return turn_log_path
+
+
+def measure_paint(backend):
+    """인트로 화면 첫 실행 -> 시작 버튼 -> 첫 채팅 화면 실행 시간"""
+    if backend == "fake":
+        import fake_genai
+        fake_genai.install()
+    prepare_app()
+
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.secrets["GOOGLE_API_KEY"] = "fake-key"
+    at.run()
+    intro_seconds = time.perf_counter() - started
+    # 인트로 화면의 메인 스레드에서 SDK를 불러오지 않았는지 (워밍업 스레드가 먼저 불러왔을 수는 있음)
+    sdk_loaded_after_intro = "google.generativeai" in sys.modules
+
+    started = time.perf_counter()
+    at.session_state["intro_watched"] = True
+    at.run()
+    chat_seconds = time.perf_counter() - started
+
+    return {
+        "intro_paint_seconds": intro_seconds,
+        "chat_paint_seconds": chat_seconds,
+        "sdk_loaded_after_intro": sdk_loaded_after_intro,
+        "errors": [str(e.value) for e in at.exception],
+    }
+
+
+def measure_first_turn(watch_intro, intro_seconds, connect_delay):
+    """새 프로세스에서 첫 메시지를 보내고 앱의 턴별 측정 로그에서 TTFT를 읽습니다."""
+    import fake_genai
+    fake_genai.CONFIG = fake_genai.FakeConfig(connect_delay=connect_delay)
+    fake_genai.install()
+    turn_log_path = prepare_app()
+
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.secrets["GOOGLE_API_KEY"] = "fake-key"
+    if watch_intro:
+        at.run()
+        time.sleep(intro_seconds) # 영상을 보는 동안 (이 사이에 워밍업 스레드가 모델 준비 + 연결)
+    started = time.perf_counter()
+    at.session_state["intro_watched"] = True
+    at.run()
+    chat_paint_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    at.chat_input[0].set_value("안녕하세요!").run()
+    turn_seconds = time.perf_counter() - started
+
+    records = read_turn_log(turn_log_path, {at.session_state["session_id"]})
+    return {
+        "ttft": records[-1]["ttft"] if records else None,
+        "turn_seconds": turn_seconds,
+        "chat_paint_seconds": chat_paint_seconds,
+        "count_tokens_calls": fake_genai.STATS.snapshot()["count_tokens_calls"],
+        "errors": [str(e.value) for e in at.exception],
+    }
+
+
+def run_child(mode, args):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, "--backend", args.backend,
+         "--intro-seconds", str(args.intro_seconds), "--connect-delay", str(args.connect_delay)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import 시간 / 첫 화면 표시 시간 측정")
+    parser.add_argument("--repeat", type=int, default=5, help="측정 반복 횟수 (매번 새 프로세스)")
+    parser.add_argument("--backend", choices=["fake", "real"], default="fake", help="paint 측정에 쓸 Gemini 백엔드")
+    parser.add_argument("--compare", help="비교할 이전 결과 파일 (기본: 가장 최근 cold_start 결과)")
+    parser.add_argument("--no-save", action="store_true", help="결과를 저장하지 않음")
+    parser.add_argument("--intro-seconds", type=float, default=2, help="first turn(warm): 인트로를 보는 시간(초)")
+    parser.add_argument("--connect-delay", type=float, default=0.5, help="first turn: 첫 API 호출의 연결 시간(초)")
+    parser.add_argument("--child", choices=["imports", "paint", "first_turn_warm", "first_turn_cold"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        if args.child == "imports":
+            result = measure_imports()
+        elif args.child == "paint":
+            result = measure_paint(args.backend)
+        else:
+            result = measure_first_turn(args.child == "first_turn_warm", args.intro_seconds, args.connect_delay)
+        print(json.dumps(result))
+        return
+
+    import_runs = [run_child("imports", args) for _ in range(args.repeat)]
+    paint_runs = [run_child("paint", args) for _ in range(args.repeat)]
+    first_turn_runs = {}
+    if args.backend == "fake":
+        for variant in ["warm", "cold"]:
+            first_turn_runs[variant] = [run_child(f"first_turn_{variant}", args) for _ in range(args.repeat)]
+
+    def median_of(runs, names):
+        totals = []
+        for run in runs:
+            values = [run.get(name) for name in names]
+            if any(value is None for value in values):
+                return None # 설치되지 않은 모듈이 있으면 측정하지 않음
+            totals.append(sum(values))
+        return percentile(totals, 0.50)
+
+    summary = {
+        "app_import_seconds": median_of(import_runs, APP_MODULES),
+        "sdk_import_seconds": median_of(import_runs, SDK_MODULES),
+        "intro_paint_seconds": percentile([r["intro_paint_seconds"] for r in paint_runs], 0.50),
+        "chat_paint_seconds": percentile([r["chat_paint_seconds"] for r in paint_runs], 0.50),
+        "sdk_loaded_after_intro": sum(r["sdk_loaded_after_intro"] for r in paint_runs),
+        "errors": sum(len(r["errors"]) for r in paint_runs),
+    }
+    for variant, runs in first_turn_runs.items():
+        summary[f"first_turn_ttft_{variant}"] = percentile([r["ttft"] for r in runs if r["ttft"] is not None], 0.50)
+        summary[f"first_turn_seconds_{variant}"] = percentile([r["turn_seconds"] for r in runs], 0.50)
+        summary[f"first_turn_chat_paint_{variant}"] = percentile([r["chat_paint_seconds"] for r in runs], 0.50)
+        summary["errors"] += sum(len(r["errors"]) for r in runs)
+
+    print_report(summary, load_previous("cold_start", args.compare), COMPARED_METRICS)
+    print(f"intro 직후 SDK가 이미 로드된 횟수: {summary['sdk_loaded_after_intro']}/{args.repeat} (워밍업 스레드), "
+          f"errors: {summary['errors']}")
+
+    if not args.no_save:
+        save_result("cold_start", vars(args), summary, imports=import_runs, paints=paint_runs, first_turns=first_turn_runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+컨텍스트 구성 벤치마크: 예전의 고정 창(최근 20개 메시지)과 토큰 예산(token_budget.build_context)의 턴별 프롬프트 토큰 수 비교.
+
+긴 합성 대화를 한 턴씩 진행하면서, 매 턴 두 방식이 API에 보낼 프롬프트(시스템 프롬프트 + 장기 기억 + history + 이번 메시지)의
+토큰 수를 셉니다.
+- 실제 토큰 수 대신 간단한 토크나이저 대용(actual_tokens)으로 셉니다. 추정기의 글자 수 규칙과는 일부러 다르게 셉니다.
+- build_context는 앱과 똑같이 TokenEstimator로 예산을 맞추고, 매 턴 그 "실제" 토큰 수로 보정합니다.
+  (예산을 넘은 턴 수 = 보정된 추정기의 오차로 예산을 넘긴 턴)
+- 대화 종류: chitchat(짧은 잡담), pastes(가끔 긴 글/코드를 붙여 넣는 대화)
+
+결과는 bench/results/context-<시각>.json 에 저장되고 직전 결과와 비교합니다.
+
+    python bench/context_bench.py --turns 300
+"""
+import argparse
+import ast
+import os
+import random
+import re
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+from run_bench import APP_PATH, PROMPTS, REPO_DIR, load_previous, percentile, print_report, save_result
+import fake_genai
+
+sys.path.insert(0, REPO_DIR)
+import token_budget
+
+FIXED_WINDOW = 20 # 예전 apply_sliding_window(window_size=20)
+SUMMARY_TEXT = "손님은 단골이고 라떼를 좋아한다. 지난번에는 메뉴판을 보고 디저트를 골랐다. " * 6 # 요약이 생긴 뒤의 장기 기억
+PASTE_EVERY = 12 # pastes 대화에서 손님 메시지 몇 개마다 긴 글을 붙여 넣을지
+PROFILES = ["chitchat", "pastes"]
+STRATEGIES = ["fixed", "budget"]
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d|[^\sA-Za-z\d]")
+
+
+def app_constant(name):
+    """gemini_chat.py의 모듈 상수 값 (스크립트를 실행하지 않고 읽음)"""
+    with open(APP_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(target, "id", None) == name for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise KeyError(name)
+
+
+def actual_tokens(text):
+    """토크나이저 대용: 영단어 하나, 숫자/기호/한글 한 글자를 각각 1토큰으로 셉니다."""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def make_conversation(profile, turns, seed):
+    """(손님 메시지, 야엘 답변) 목록"""
+    rng = random.Random(seed)
+    paste = "def brew(beans, water):\n    return beans * 0.06 + water  # 원두 비율 계산\n"
+    pairs = []
+    for turn in range(turns):
+        user = rng.choice(PROMPTS) * rng.randint(1, 3)
+        if profile == "pastes" and turn % PASTE_EVERY == PASTE_EVERY - 1:
+            user = "이 코드 좀 봐주세요:\n" + paste * rng.randint(40, 160)
+        reply = fake_genai.REPLY_TEXT * rng.randint(1, 5)
+        pairs.append((user, reply))
+    return pairs
+
+
+def simulate(profile, strategy, turns, budget, instruction, seed):
+    """턴마다 실제 프롬프트 토큰 수와 history에 들어간 메시지 수"""
+    estimator = token_budget.TokenEstimator()
+    overhead = token_budget.MESSAGE_TOKEN_OVERHEAD
+    messages = []
+    summarized = False # 컨텍스트에서 빠진 대화가 생기면 그 뒤로는 장기 기억이 시스템 프롬프트에 붙음
+    prompt_tokens = []
+    history_sizes = []
+
+    for user, reply in make_conversation(profile, turns, seed):
+        active_instruction = instruction + (f"\n\n[기억된 과거 대화 요약]: {SUMMARY_TEXT}" if summarized else "")
+        if strategy == "fixed":
+            history = messages[-FIXED_WINDOW:]
+            summarized = summarized or len(messages) > FIXED_WINDOW
+        else:
+            reserved = estimator.estimate(active_instruction) + estimator.estimate(user) + overhead
+            _, window_start = token_budget.build_context(messages, budget, reserved, estimator)
+            history = messages[window_start:]
+            summarized = summarized or window_start > 0
+
+        tokens = actual_tokens(active_instruction) + actual_tokens(user) + overhead + sum(
+            actual_tokens(msg["content"]) + overhead for msg in history
+        )
+        if strategy == "budget":
+            raw_estimate = token_budget.estimate_raw_tokens(active_instruction) + token_budget.estimate_raw_tokens(user) + sum(
+                token_budget.estimate_raw_tokens(msg["content"]) for msg in history
+            )
+            estimator.calibrate(raw_estimate, tokens)
+
+        prompt_tokens.append(tokens)
+        history_sizes.append(len(history))
+        messages += [{"role": "user", "content": user}, {"role": "assistant", "content": reply}]
+
+    return prompt_tokens, history_sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="고정 20개 창 vs 토큰 예산 컨텍스트의 턴별 프롬프트 토큰 수 비교")
+    parser.add_argument("--turns", type=int, default=300, help="대화 하나의 턴 수")
+    parser.add_argument("--budget", type=int, default=None, help="입력 토큰 예산 (기본: 앱의 CONTEXT_TOKEN_BUDGET)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", help="비교할 이전 결과 파일 (기본: 가장 최근 context 결과)")
+    parser.add_argument("--no-save", action="store_true", help="결과를 저장하지 않음")
+    args = parser.parse_args()
+
+    budget = args.budget or app_constant("CONTEXT_TOKEN_BUDGET")
+    instruction = app_constant("base_instruction")
+
+    summary = {}
+    compared_metrics = []
+    for profile in PROFILES:
+        for strategy in STRATEGIES:
+            tokens, history_sizes = simulate(profile, strategy, args.turns, budget, instruction, args.seed)
+            prefix = f"{profile}_{strategy}"
+            summary.update({
+                f"{prefix}_tokens_mean": sum(tokens) / len(tokens),
+                f"{prefix}_tokens_p95": percentile(tokens, 0.95),
+                f"{prefix}_tokens_max": max(tokens),
+                f"{prefix}_tokens_total": sum(tokens),
+                f"{prefix}_over_budget_turns": sum(1 for value in tokens if value > budget),
+                f"{prefix}_history_mean": sum(history_sizes) / len(history_sizes),
+                f"{prefix}_history_min": min(history_sizes[FIXED_WINDOW:] or history_sizes),
+            })
+            compared_metrics += [
+                (f"{prefix}_tokens_mean", f"{prefix} tokens mean", True),
+                (f"{prefix}_tokens_max", f"{prefix} tokens max", True),
+                (f"{prefix}_over_budget_turns", f"{prefix} over budget", True),
+                (f"{prefix}_history_mean", f"{prefix} history msgs", False),
+            ]
+
+    print(f"turns: {args.turns}, budget: {budget} tokens")
+    print_report(summary, load_previous("context", args.compare), compared_metrics)
+    if not args.no_save:
+        save_result("context", vars(args), summary)
+
+
+if __name__ == "__main__":
+    main()
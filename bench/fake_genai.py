@@ -0,0 +1,225 @@
+"""
+벤치마크용 가짜 Gemini 백엔드.
+
+install()을 부르면 google.generativeai / google.generativeai.types / google.api_core.exceptions 자리에
+이 모듈의 가짜 구현이 들어갑니다. (API 키나 할당량 없이 앱 전체를 돌려볼 수 있도록)
+
+- 프로세스의 첫 API 호출은 connect_delay만큼 더 걸립니다. (클라이언트 생성 + 연결/인증, 이후 호출은 연결을 재사용)
+- 답변은 chunk_size 글자씩 나눠서 chunk_delay 간격으로 흘려보냅니다. (첫 청크 전에는 first_chunk_delay)
+- usage_metadata(입력/출력 토큰 수)를 채워서 돌려줍니다.
+- rate_limit_every번째 채팅 요청마다 ResourceExhausted(429)를 냅니다.
+- tag_every번째 답변마다 제어 태그({{SHOW_MENU}} 등)를 답변 중간에 섞습니다.
+- 호출 횟수와 요약 프롬프트 크기 등은 STATS에 모입니다.
+"""
+import enum
+import sys
+import threading
+import time
+import types
+
+
+class FakeConfig:
+    def __init__(self, chunk_size=12, chunk_delay=0.02, first_chunk_delay=0.3, reply_chars=240,
+                 rate_limit_every=0, tag_every=4, tag="{{SHOW_MENU}}", summary_delay=0.5, connect_delay=0.0):
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.first_chunk_delay = first_chunk_delay
+        self.reply_chars = reply_chars
+        self.rate_limit_every = rate_limit_every # 0이면 429를 내지 않음
+        self.tag_every = tag_every               # 0이면 태그를 넣지 않음
+        self.tag = tag
+        self.summary_delay = summary_delay
+        self.connect_delay = connect_delay
+
+
+class FakeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.chat_calls = 0
+        self.rate_limited = 0
+        self.count_tokens_calls = 0
+        self.summary_calls = 0
+        self.summary_prompt_chars = [] # 요약 요청마다 프롬프트 길이(글자 수)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "chat_calls": self.chat_calls,
+                "rate_limited": self.rate_limited,
+                "count_tokens_calls": self.count_tokens_calls,
+                "summary_calls": self.summary_calls,
+                "summary_prompt_chars": list(self.summary_prompt_chars),
+            }
+
+
+CONFIG = FakeConfig()
+STATS = FakeStats()
+
+REPLY_TEXT = "어서 오세요, 우이메카 카페입니다! 오늘은 원두를 새로 볶아서 향이 아주 좋아요. "
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 2)
+
+
+_connect_lock = threading.Lock()
+_connected = False
+
+
+def _connect():
+    """첫 호출만 연결 시간을 기다립니다. 연결 중에 들어온 다른 호출도 연결이 끝날 때까지 기다림"""
+    global _connected
+    with _connect_lock:
+        if not _connected:
+            time.sleep(CONFIG.connect_delay)
+            _connected = True
+
+
+# --- google.api_core.exceptions ---
+class ResourceExhausted(Exception):
+    code = 429
+
+
+# --- google.generativeai.types ---
+class HarmCategory(enum.IntEnum):
+    HARM_CATEGORY_HARASSMENT = 7
+    HARM_CATEGORY_HATE_SPEECH = 8
+    HARM_CATEGORY_SEXUALLY_EXPLICIT = 9
+    HARM_CATEGORY_DANGEROUS_CONTENT = 10
+
+
+class HarmBlockThreshold(enum.IntEnum):
+    BLOCK_NONE = 4
+
+
+# --- google.generativeai ---
+class UsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StreamResponse:
+    """send_message(stream=True)의 결과처럼 청크를 하나씩 흘려보냅니다."""
+
+    def __init__(self, reply, prompt_tokens):
+        self.text = reply
+        self.usage_metadata = UsageMetadata(prompt_tokens, _estimate_tokens(reply))
+
+    def __iter__(self):
+        time.sleep(CONFIG.first_chunk_delay)
+        for start in range(0, len(self.text), CONFIG.chunk_size):
+            if start:
+                time.sleep(CONFIG.chunk_delay)
+            yield Chunk(self.text[start:start + CONFIG.chunk_size])
+
+
+class Response:
+    def __init__(self, text, prompt_tokens):
+        self.text = text
+        self.usage_metadata = UsageMetadata(prompt_tokens, _estimate_tokens(text))
+
+
+def _make_reply(call_number):
+    reply = (REPLY_TEXT * (CONFIG.reply_chars // len(REPLY_TEXT) + 1))[:CONFIG.reply_chars]
+    if CONFIG.tag_every and call_number % CONFIG.tag_every == 0:
+        middle = len(reply) // 2
+        reply = reply[:middle] + CONFIG.tag + reply[middle:]
+    return reply
+
+
+class ChatSession:
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False):
+        _connect()
+        with STATS._lock:
+            STATS.chat_calls += 1
+            call_number = STATS.chat_calls
+            if CONFIG.rate_limit_every and call_number % CONFIG.rate_limit_every == 0:
+                STATS.rate_limited += 1
+                raise ResourceExhausted("429 Resource has been exhausted (fake)")
+
+        prompt_text = (self.model.system_instruction or "") + "".join(str(entry) for entry in self.history) + content
+        reply = _make_reply(call_number)
+        self.history = self.history + [
+            {"role": "user", "parts": [content]},
+            {"role": "model", "parts": [reply]},
+        ]
+        response = StreamResponse(reply, _estimate_tokens(prompt_text))
+        if not stream:
+            list(response)
+        return response
+
+
+class GenerativeModel:
+    def __init__(self, model_name="", system_instruction=None, safety_settings=None, generation_config=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.safety_settings = safety_settings
+        self.generation_config = generation_config
+
+    def start_chat(self, history=None):
+        return ChatSession(self, history)
+
+    def count_tokens(self, contents):
+        _connect()
+        with STATS._lock:
+            STATS.count_tokens_calls += 1
+        return types.SimpleNamespace(total_tokens=_estimate_tokens(str(contents)))
+
+    def generate_content(self, contents):
+        # 앱에서는 요약할 때만 generate_content를 씁니다.
+        prompt = str(contents)
+        _connect()
+        with STATS._lock:
+            STATS.summary_calls += 1
+            STATS.summary_prompt_chars.append(len(prompt))
+        time.sleep(CONFIG.summary_delay)
+        return Response("손님은 커피를 좋아하고 메뉴판을 본 적이 있다.", _estimate_tokens(prompt))
+
+
+def configure(api_key=None, **kwargs):
+    pass
+
+
+def install():
+    """sys.modules에 가짜 google.generativeai / google.api_core를 등록합니다. (앱을 실행하기 전에 호출)"""
+    try:
+        import google # protobuf 등 다른 google.* 패키지는 그대로 쓸 수 있도록 실제 namespace를 유지
+    except ImportError:
+        google = types.ModuleType("google")
+        google.__path__ = []
+
+    generativeai = types.ModuleType("google.generativeai")
+    generativeai.configure = configure
+    generativeai.GenerativeModel = GenerativeModel
+    generativeai.ChatSession = ChatSession
+
+    genai_types = types.ModuleType("google.generativeai.types")
+    genai_types.HarmCategory = HarmCategory
+    genai_types.HarmBlockThreshold = HarmBlockThreshold
+    generativeai.types = genai_types
+
+    api_core = types.ModuleType("google.api_core")
+    exceptions = types.ModuleType("google.api_core.exceptions")
+    exceptions.ResourceExhausted = ResourceExhausted
+    api_core.exceptions = exceptions
+
+    google.generativeai = generativeai
+    google.api_core = api_core
+    sys.modules.update({
+        "google": google,
+        "google.generativeai": generativeai,
+        "google.generativeai.types": genai_types,
+        "google.api_core": api_core,
+        "google.api_core.exceptions": exceptions,
+    })
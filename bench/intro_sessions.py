@@ -0,0 +1,143 @@
+"""
+인트로 화면 동시 접속 테스트: 새 방문자 N명이 동시에 들어와도 인트로가 스크립트 스레드를 붙잡지 않는지 확인합니다.
+
+예전 인트로는 time.sleep(VIDEO_LENGTH)로 기다렸기 때문에 방문자마다 스크립트 실행이 VIDEO_LENGTH초씩 걸렸습니다.
+지금은 fragment 타이머가 경과 시간만 확인하므로, 인트로 화면의 run() 한 번은 바로 끝나야 합니다.
+
+- N개의 새 세션(AppTest)을 동시에 실행해서 세션마다 인트로 run() 시간을 잽니다.
+  가장 느린 run()이 VIDEO_LENGTH의 절반보다 짧고, N개가 모두 끝나는 데 VIDEO_LENGTH보다 덜 걸려야 통과합니다.
+  (sleep 방식이면 세션 하나만으로도 VIDEO_LENGTH가 걸림)
+  AppTest는 모든 세션을 한 프로세스에서 돌리므로 run()의 CPU 시간은 GIL 때문에 세션 수만큼 늘어납니다.
+  비교용으로 빈 스크립트를 같은 방식으로 실행한 시간(AppTest 자체 비용)도 함께 보여줍니다.
+- 실행이 끝난 뒤 남아 있는 스크립트 스레드가 없어야 합니다.
+- 기존 동작 유지: VIDEO_LENGTH가 지나면 다음 실행에서 채팅 화면으로 넘어가고, 스킵 버튼을 누르면 바로 넘어갑니다.
+
+기본은 가짜 백엔드(fake_genai)를 씁니다. 하나라도 실패하면 종료 코드 1로 끝납니다.
+
+    python bench/intro_sessions.py --sessions 8
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+from run_bench import APP_PATH, REPO_DIR, allow_concurrent_apptests, percentile
+import fake_genai
+
+
+def video_length():
+    """gemini_chat.py의 VIDEO_LENGTH (인트로 자동 넘김까지의 초)"""
+    with open(APP_PATH, encoding="utf-8") as f:
+        return int(re.search(r"VIDEO_LENGTH = (\d+)", f.read()).group(1))
+
+
+def new_session(timeout, script_path=APP_PATH):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(script_path, default_timeout=timeout)
+    at.secrets["GOOGLE_API_KEY"] = "fake-key"
+    return at
+
+
+def run_intro(timeout, script_path=APP_PATH):
+    """새 방문자 한 명: 인트로 화면 첫 실행 시간"""
+    at = new_session(timeout, script_path)
+    started = time.perf_counter()
+    at.run()
+    return {
+        "seconds": time.perf_counter() - started,
+        "intro_watched": at.session_state["intro_watched"] if "intro_watched" in at.session_state else False,
+        "errors": [str(e.value) for e in at.exception],
+    }
+
+
+def run_concurrently(sessions, timeout, script_path=APP_PATH):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        runs = list(pool.map(lambda _: run_intro(timeout, script_path), range(sessions)))
+    return runs, time.perf_counter() - started
+
+
+def check_auto_advance(length, timeout):
+    """VIDEO_LENGTH가 지난 뒤의 타이머 실행이 채팅 화면으로 넘어가는지 (AppTest는 run_every를 돌리지 않으므로 직접 실행)"""
+    at = new_session(timeout)
+    at.run()
+    at.session_state["intro_started_at"] = time.time() - length
+    at.run()
+    return at.session_state["intro_watched"] and bool(at.chat_input)
+
+
+def check_skip_button(timeout):
+    """스킵 버튼을 누르면 바로 채팅 화면으로 넘어가는지"""
+    at = new_session(timeout)
+    at.run()
+    at.button[0].click().run()
+    return at.session_state["intro_watched"] and bool(at.chat_input)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="새 세션 N개의 동시 인트로 실행 시간 확인")
+    parser.add_argument("--sessions", type=int, default=8, help="동시에 들어오는 새 세션 수 (N)")
+    parser.add_argument("--timeout", type=float, default=60, help="run() 하나의 최대 시간(초)")
+    args = parser.parse_args()
+
+    fake_genai.install()
+    allow_concurrent_apptests()
+    workdir = tempfile.mkdtemp(prefix="yael-intro-")
+    os.environ.update({
+        "CONVERSATION_STORE_PATH": os.path.join(workdir, "conversations.sqlite3"),
+        "METRICS_LOG_PATH": os.path.join(workdir, "turns.jsonl"),
+    })
+    os.chdir(REPO_DIR)
+
+    length = video_length()
+    limit = length / 2
+
+    empty_script = os.path.join(workdir, "empty_app.py")
+    with open(empty_script, "w", encoding="utf-8") as f:
+        f.write("import streamlit as st\nst.write('')\n")
+
+    new_session(args.timeout).run() # 첫 import / cache_resource 생성 비용은 제외
+    new_session(args.timeout, empty_script).run()
+
+    runs, wall = run_concurrently(args.sessions, args.timeout)
+    empty_runs, empty_wall = run_concurrently(args.sessions, args.timeout, empty_script)
+
+    timings = [run["seconds"] for run in runs]
+    empty_timings = [run["seconds"] for run in empty_runs]
+    errors = [error for run in runs for error in run["errors"]]
+    leftover_threads = [t.name for t in threading.enumerate() if t.name.startswith("ScriptRunner")]
+
+    print(f"sessions: {args.sessions}, VIDEO_LENGTH: {length}s")
+    print(f"intro run() p50 {percentile(timings, 0.50):.3f}s, p95 {percentile(timings, 0.95):.3f}s, "
+          f"max {max(timings):.3f}s, wall {wall:.3f}s (sleep 방식이면 세션마다 {length}s 이상)")
+    print(f"빈 스크립트 run() p50 {percentile(empty_timings, 0.50):.3f}s, max {max(empty_timings):.3f}s, "
+          f"wall {empty_wall:.3f}s (AppTest 자체 비용)")
+
+    checks = [
+        (f"가장 느린 인트로 run() < {limit:.1f}s", max(timings) < limit),
+        (f"{args.sessions}개 세션 전체 < {length}s", wall < length),
+        ("인트로에서 바로 넘어간 세션 없음", not any(run["intro_watched"] for run in runs)),
+        ("에러 없음", not errors),
+        ("남아 있는 스크립트 스레드 없음", not leftover_threads),
+        (f"{length}s 뒤 자동으로 채팅 화면", check_auto_advance(length, args.timeout)),
+        ("스킵 버튼으로 채팅 화면", check_skip_button(args.timeout)),
+    ]
+    for label, passed in checks:
+        print(f"[{'PASS' if passed else 'FAIL'}] {label}")
+    if errors:
+        print(f"errors: {errors[:3]}")
+    if leftover_threads:
+        print(f"threads: {leftover_threads}")
+
+    sys.exit(0 if all(passed for _, passed in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+모델 풀 벤치마크: 동시에 들어온 세션들이 모델/채팅 세션을 준비하는 데 드는 시간과 메모리.
+
+세션 하나가 하는 일 (API 호출 없이 객체 생성만):
+- 기본 시스템 프롬프트로 모델을 받아 start_chat()
+- 요약용 모델(max_output_tokens 설정)을 받음
+- 요약이 들어간 시스템 프롬프트로 모델을 다시 받아 start_chat()
+
+이것을 세션마다 GenerativeModel을 새로 만드는 방식(per-session)과 ModelPool을 쓰는 방식(pool)으로
+각각 새 프로세스에서 실행하고, 세션별 준비 시간과 tracemalloc 기준 메모리를 비교합니다.
+google.generativeai가 설치되어 있으면 실제 SDK 객체로, 없으면 fake_genai로 측정합니다.
+
+    python bench/model_pool_bench.py --sessions 100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+from run_bench import REPO_DIR, load_previous, percentile, print_report, save_result
+
+MODEL_NAME = "models/gemini-flash-lite-latest"
+SUMMARY_CONFIG = {"max_output_tokens": 512}
+BASE_INSTRUCTION = "너의 이름은 '야엘 슈브'야. 직업은 메이드장이면서 카페의 지배인이야. " * 20
+
+COMPARED_METRICS = [
+    ("pool_setup_p50_ms", "pool setup p50 (ms)", True),
+    ("pool_setup_p95_ms", "pool setup p95 (ms)", True),
+    ("pool_memory_per_session_kb", "pool memory/session (KB)", True),
+    ("pool_models_created", "pool models created", True),
+    ("per_session_setup_p50_ms", "per-session setup p50 (ms)", True),
+    ("per_session_memory_per_session_kb", "per-session memory (KB)", True),
+]
+
+
+def safety_settings():
+    from google.generativeai.types import HarmCategory, HarmBlockThreshold
+    return {
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
+
+
+def run_child(mode, sessions, backend):
+    if backend == "fake":
+        import fake_genai
+        fake_genai.install()
+    import google.generativeai as genai
+    sys.path.insert(0, REPO_DIR)
+    import model_pool
+
+    pool = model_pool.ModelPool(MODEL_NAME, safety_settings, max_size=64)
+    settings = safety_settings()
+
+    def get_model(instruction=None, generation_config=None):
+        if mode == "pool":
+            return pool.get(instruction, generation_config)
+        return genai.GenerativeModel(
+            model_name=MODEL_NAME, system_instruction=instruction,
+            safety_settings=settings, generation_config=generation_config,
+        )
+
+    def setup_session(index):
+        started = time.perf_counter()
+        chat = get_model(BASE_INSTRUCTION).start_chat(history=[])
+        summarizer = get_model(generation_config=SUMMARY_CONFIG)
+        summary_instruction = BASE_INSTRUCTION + f"\n\n[기억된 과거 대화 요약]: 손님 {index}번은 라떼를 좋아한다."
+        chat = get_model(summary_instruction).start_chat(history=[])
+        return time.perf_counter() - started, (chat, summarizer)
+
+    get_model(BASE_INSTRUCTION) # import / 첫 생성 비용은 양쪽 모두 제외
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(setup_session, range(sessions)))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = [seconds * 1000 for seconds, _ in results]
+    return {
+        "setup_p50_ms": percentile(timings, 0.50),
+        "setup_p95_ms": percentile(timings, 0.95),
+        "memory_per_session_kb": (current - before) / sessions / 1024,
+        "peak_kb": (peak - before) / 1024,
+        "models_created": pool.stats()["created"] if mode == "pool" else sessions * 3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="모델 풀 사용 전/후 세션 준비 시간과 메모리 비교")
+    parser.add_argument("--sessions", type=int, default=100, help="동시에 준비하는 세션 수")
+    parser.add_argument("--backend", choices=["real", "fake"], default=None,
+                        help="기본: google.generativeai가 설치되어 있으면 real")
+    parser.add_argument("--compare", help="비교할 이전 결과 파일 (기본: 가장 최근 model_pool 결과)")
+    parser.add_argument("--no-save", action="store_true", help="결과를 저장하지 않음")
+    parser.add_argument("--child", choices=["pool", "per_session"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend is None:
+        try:
+            import google.generativeai # noqa: F401
+            args.backend = "real"
+        except ImportError:
+            args.backend = "fake"
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.sessions, args.backend)))
+        return
+
+    summary = {}
+    for mode in ["per_session", "pool"]:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode,
+             "--sessions", str(args.sessions), "--backend", args.backend],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        for key, value in json.loads(output.strip().splitlines()[-1]).items():
+            summary[f"{mode}_{key}"] = value
+
+    print(f"backend: {args.backend}, sessions: {args.sessions}")
+    print_report(summary, load_previous("model_pool", args.compare), COMPARED_METRICS)
+    if not args.no_save:
+        save_result("model_pool", vars(args), summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+"""
+부하/성능 벤치마크: 가짜 Gemini 백엔드(fake_genai)로 gemini_chat.py를 AppTest로 실행합니다.
+
+N개의 세션이 동시에 M턴씩 대화하면서 다음을 측정합니다.
+- rerun 지연 시간 (메시지를 보내고 화면이 다 그려질 때까지)
+- 첫 토큰까지 걸린 시간(TTFT), 답변 markdown 양 (앱의 턴별 측정 로그 기준)
+- 턴마다 클라이언트로 보내는 전체 메시지 크기 (ForwardMsg 직렬화 크기 합계: 장면/아바타/기록 포함)
+  AppTest는 fragment만이 아니라 스크립트 전체를 다시 실행하므로 전체 화면 기준입니다.
+  (실제 서버에서는 채팅 턴에 chat_area fragment 부분만 보내므로 이보다 작음)
+- 세션당 메모리 증가량 (tracemalloc)
+- 요약 호출 횟수와 요약 프롬프트 크기 (대화가 컨텍스트 윈도우를 넘어갈 때)
+
+시작할 때 앱이 참조하는 img/ 파일 중 없는 것을 알려줍니다. (없는 이미지는 앱이 건너뛰므로 측정값이 달라짐)
+
+결과는 bench/results/load-<시각>.json 에 저장되고, 직전 결과와 비교한 표를 출력합니다.
+
+--seed-messages를 주면 대신 긴 대화 모드로 실행합니다. (결과: bench/results/history-<시각>.json)
+저장소에 메시지를 크기별로 미리 넣어 둔 세션(?sid=...)을 열고, 첫 화면과 채팅 턴마다
+chat_area fragment 실행 시간 / 기록 그리기 시간 / 보낸 메시지 크기를 잽니다.
+최근 페이지만 그리는 기본 화면(page)과, 페이지를 모두 펼쳐서 전체 기록을 그리는 화면(all, 페이지 나누기 전과 같은 양)을 비교합니다.
+
+    python bench/run_bench.py --sessions 4 --turns 15
+    python bench/run_bench.py --sessions 1 --turns 20 --rate-limit-every 5 --compare bench/results/load-20260101-120000.json
+    python bench/run_bench.py --seed-messages 50,500,5000 --turns 3 --first-chunk-delay 0 --chunk-delay 0
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, "gemini_chat.py")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+sys.path.insert(0, BENCH_DIR)
+import fake_genai
+
+PROMPTS = [
+    "안녕하세요!",
+    "메뉴판 보여줘",
+    "오늘 추천 메뉴는 뭐예요?",
+    "아이스 아메리카노 한 잔 주세요.",
+    "야엘은 이 카페에서 일한 지 얼마나 됐어?",
+    "디저트도 있나요?",
+    "여기 분위기가 참 좋네요.",
+    "지난번에 마신 라떼가 맛있었어요.",
+]
+
+# 비교 표에 보여줄 항목: (결과 키, 표시 이름, 낮을수록 좋은지)
+COMPARED_METRICS = [
+    ("rerun_p50", "rerun p50 (s)", True),
+    ("rerun_p95", "rerun p95 (s)", True),
+    ("ttft_p50", "TTFT p50 (s)", True),
+    ("ttft_p95", "TTFT p95 (s)", True),
+    ("bytes_per_turn", "reply bytes/turn", True),
+    ("payload_bytes_per_turn", "payload bytes/turn", True),
+    ("memory_per_session_kb", "memory/session (KB)", True),
+    ("summary_calls", "summary calls", True),
+    ("summary_prompt_chars_max", "summary prompt max (chars)", True),
+]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def missing_assets():
+    """gemini_chat.py가 참조하는 img/ 파일 중 저장소에 없는 것"""
+    with open(APP_PATH, encoding="utf-8") as f:
+        paths = sorted(set(re.findall(r"[\"'](img/[^\"']+)[\"']", f.read())))
+    return [path for path in paths if not os.path.exists(os.path.join(REPO_DIR, path))]
+
+
+# AppTest의 run() 한 번 동안 스크립트가 보낸 ForwardMsg의 직렬화 크기 합계.
+# 메시지는 스크립트 스레드에서 큐에 들어가므로, run()을 부른 스레드(세션 스레드)에 결과를 남깁니다.
+_payload = threading.local()
+
+
+def install_payload_counter():
+    from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    original_enqueue = ForwardMsgQueue.enqueue
+    original_run = LocalScriptRunner.run
+
+    def enqueue(self, msg):
+        counter = getattr(self, "bench_payload_bytes", None)
+        if counter is not None:
+            counter[0] += msg.ByteSize()
+        return original_enqueue(self, msg)
+
+    def run(self, *args, **kwargs):
+        self.forward_msg_queue.bench_payload_bytes = counter = [0]
+        try:
+            return original_run(self, *args, **kwargs)
+        finally:
+            _payload.bytes = counter[0]
+
+    ForwardMsgQueue.enqueue = enqueue
+    LocalScriptRunner.run = run
+
+
+def allow_concurrent_apptests():
+    """
+    AppTest는 run()마다 가짜 Runtime을 전역(Runtime._instance)에 넣었다가 끝나면 None으로 지웁니다.
+    여러 세션을 스레드로 동시에 돌리면 한 세션이 끝나면서 지운 사이에 다른 세션의 스크립트가
+    "Runtime hasn't been created!"로 멈추므로, 지워진 뒤에도 마지막 Runtime을 계속 돌려주게 합니다.
+    """
+    from streamlit.runtime import Runtime
+
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+            return cls._instance
+        if "runtime" in last:
+            return last["runtime"]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    def exists(cls):
+        return cls._instance is not None or "runtime" in last
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+    # 파이썬 3.11의 ast.parse는 여러 스레드에서 동시에 부르면 SystemError
+    # ("AST constructor recursion depth mismatch")가 날 수 있어서, 스크립트 컴파일만 한 번에 하나씩
+    from streamlit.runtime.scriptrunner import magic
+
+    original_add_magic = magic.add_magic
+    parse_lock = threading.Lock()
+
+    def add_magic(*args, **kwargs):
+        with parse_lock:
+            return original_add_magic(*args, **kwargs)
+
+    magic.add_magic = add_magic
+
+
+def run_session(index, turns, timeout):
+    """세션 하나: 인트로를 건너뛰고 turns번 메시지를 보내면서 턴마다 rerun 시간을 잽니다."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.secrets["GOOGLE_API_KEY"] = "fake-key"
+    at.session_state["intro_watched"] = True
+    at.run()
+    session_id = at.session_state["session_id"]
+
+    results = []
+    for turn in range(1, turns + 1):
+        prompt = PROMPTS[(index + turn) % len(PROMPTS)]
+        started = time.perf_counter()
+        if not at.chat_input:
+            # 스크립트가 예외로 멈춰 입력창이 그려지지 않음 -> 이 세션은 여기서 중단하고 에러로 보고
+            print(f"session {index}: turn {turn} 입력창 없음, 중단: {[str(e.value) for e in at.exception]}")
+            results.append({
+                "session_id": session_id, "turn": turn, "messages": turn * 2, "rerun_seconds": None,
+                "payload_bytes": None, "errors": [str(e.value) for e in at.exception] or ["chat_input missing"],
+                "summary_calls_so_far": fake_genai.STATS.snapshot()["summary_calls"],
+            })
+            break
+        _payload.bytes = None
+        at.chat_input[0].set_value(prompt).run()
+        results.append({
+            "session_id": session_id,
+            "turn": turn,
+            "messages": turn * 2,
+            "rerun_seconds": time.perf_counter() - started,
+            "payload_bytes": _payload.bytes,
+            "errors": [str(e.value) for e in at.exception],
+            "summary_calls_so_far": fake_genai.STATS.snapshot()["summary_calls"],
+        })
+    return results
+
+
+SEED_IMAGE_EVERY = 10     # 미리 넣는 대화에서 야엘 답변 몇 개마다 이미지를 붙일지
+SEED_UNSUMMARIZED = 40    # 미리 넣는 대화 중 아직 요약되지 않은 최근 메시지 수
+
+
+def seed_conversation(store_path, size):
+    """저장소에 size개의 메시지(손님/야엘 번갈아, 가끔 이미지 포함)를 넣고 세션 id를 돌려줍니다."""
+    sys.path.insert(0, REPO_DIR)
+    import conversation_store
+
+    store = conversation_store.open_store("sqlite", store_path)
+    session_id = uuid.uuid4().hex
+    for index in range(size):
+        if index % 2 == 0:
+            message = {"role": "user", "content": PROMPTS[index // 2 % len(PROMPTS)]}
+        else:
+            message = {"role": "assistant", "content": f"**{index}번째 답변** " + fake_genai.REPLY_TEXT * 3}
+            if index % (SEED_IMAGE_EVERY * 2) == 1:
+                message["images"] = ["img/cafe_menu.jpg"]
+        store.append(session_id, message)
+    # 오래 쓴 세션의 평소 상태처럼 앞부분은 이미 요약된 것으로 둠 (요약 작업이 전체 기록을 다시 읽지 않도록)
+    store.save_memory(session_id, "손님은 단골이고 라떼를 좋아한다.", max(0, size - SEED_UNSUMMARIZED))
+    return session_id
+
+
+def run_seeded_session(session_id, turns, timeout, all_pages):
+    """미리 채운 세션을 열어서 첫 화면 시간을 재고, turns번 메시지를 보냅니다."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.secrets["GOOGLE_API_KEY"] = "fake-key"
+    at.session_state["intro_watched"] = True
+    at.query_params["sid"] = session_id
+    if all_pages:
+        at.session_state["history_pages"] = 10 ** 6 # 모든 페이지를 펼침 = 전체 기록을 그림
+
+    _payload.bytes = None
+    started = time.perf_counter()
+    at.run()
+    first = {"seconds": time.perf_counter() - started, "payload_bytes": _payload.bytes}
+
+    results = []
+    for turn in range(1, turns + 1):
+        if not at.chat_input:
+            results.append({"rerun_seconds": None, "payload_bytes": None,
+                            "errors": [str(e.value) for e in at.exception] or ["chat_input missing"]})
+            break
+        _payload.bytes = None
+        started = time.perf_counter()
+        at.chat_input[0].set_value(PROMPTS[turn % len(PROMPTS)]).run()
+        results.append({
+            "rerun_seconds": time.perf_counter() - started,
+            "payload_bytes": _payload.bytes,
+            "errors": [str(e.value) for e in at.exception],
+        })
+    return first, results
+
+
+def run_history_bench(sizes, turns, timeout, store_path, turn_log_path):
+    """크기별로 page / all 화면을 실행하고 {"page_500_fragment_p50": ...} 형태의 요약을 돌려줍니다."""
+    summary = {}
+    details = []
+    for size in sizes:
+        for mode in ["page", "all"]:
+            session_id = seed_conversation(store_path, size)
+            first, results = run_seeded_session(session_id, turns, timeout, all_pages=(mode == "all"))
+            turn_log = read_turn_log(turn_log_path, {session_id})
+            prefix = f"{mode}_{size}"
+            summary.update({
+                f"{prefix}_first_paint": first["seconds"],
+                f"{prefix}_first_payload_kb": (first["payload_bytes"] or 0) / 1024,
+                f"{prefix}_rerun_p50": percentile([r["rerun_seconds"] for r in results if r["rerun_seconds"] is not None], 0.50),
+                f"{prefix}_fragment_p50": percentile([r["rerun_seconds"] for r in turn_log], 0.50),
+                f"{prefix}_history_render_p50": percentile([r["history_render_seconds"] for r in turn_log], 0.50),
+                f"{prefix}_payload_kb_per_turn": percentile([(r["payload_bytes"] or 0) / 1024 for r in results], 0.50),
+                f"{prefix}_errors": sum(len(r["errors"]) for r in results),
+            })
+            details.append({"size": size, "mode": mode, "first": first, "turns": results, "turn_log": turn_log})
+    return summary, details
+
+
+def history_metrics(sizes):
+    metrics = []
+    for size in sizes:
+        for mode in ["page", "all"]:
+            prefix = f"{mode}_{size}"
+            metrics += [
+                (f"{prefix}_first_paint", f"{prefix} first paint (s)", True),
+                (f"{prefix}_fragment_p50", f"{prefix} fragment p50 (s)", True),
+                (f"{prefix}_history_render_p50", f"{prefix} history p50 (s)", True),
+                (f"{prefix}_payload_kb_per_turn", f"{prefix} payload/turn (KB)", True),
+            ]
+    return metrics
+
+
+def read_turn_log(path, session_ids):
+    """앱이 남긴 턴별 측정 로그(JSONL)에서 이번 벤치마크 세션의 기록만 읽습니다."""
+    records = []
+    for log_path in sorted(glob.glob(path + "*")): # 로그 교체로 생긴 .1, .2 파일 포함
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("session_id") in session_ids:
+                    records.append(record)
+    return records
+
+
+def wait_for_summaries(settle_seconds, timeout=30):
+    """백그라운드 요약 작업이 끝날 때까지 (요약 호출 수가 settle_seconds 동안 변하지 않을 때까지) 기다립니다."""
+    deadline = time.monotonic() + timeout
+    last = fake_genai.STATS.snapshot()["summary_calls"]
+    stable_since = time.monotonic()
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        current = fake_genai.STATS.snapshot()["summary_calls"]
+        if current != last:
+            last, stable_since = current, time.monotonic()
+        elif time.monotonic() - stable_since >= settle_seconds:
+            break
+
+
+def summarize(turn_results, turn_log, fake_stats, memory_bytes, sessions):
+    rerun = [r["rerun_seconds"] for r in turn_results if r["rerun_seconds"] is not None]
+    ttft = [r["ttft"] for r in turn_log if r.get("ttft") is not None]
+    bytes_pushed = [r["bytes_pushed"] for r in turn_log if r.get("bytes_pushed") is not None]
+    payload = [r["payload_bytes"] for r in turn_results if r.get("payload_bytes") is not None]
+    summary_chars = fake_stats["summary_prompt_chars"]
+
+    # 순차 실행(세션 1개)일 때만 정확: 처음으로 요약이 호출된 턴의 대화 길이
+    first_summary_at = next((r["messages"] for r in turn_results if r["summary_calls_so_far"] > 0), None)
+
+    return {
+        "turns": len(turn_results),
+        "errors": sum(len(r["errors"]) for r in turn_results),
+        "rerun_p50": percentile(rerun, 0.50),
+        "rerun_p95": percentile(rerun, 0.95),
+        "rerun_max": max(rerun) if rerun else None,
+        "ttft_p50": percentile(ttft, 0.50),
+        "ttft_p95": percentile(ttft, 0.95),
+        "bytes_per_turn": sum(bytes_pushed) / len(bytes_pushed) if bytes_pushed else None,
+        "bytes_total": sum(bytes_pushed),
+        "payload_bytes_per_turn": sum(payload) / len(payload) if payload else None,
+        "payload_bytes_max": max(payload) if payload else None,
+        "memory_per_session_kb": memory_bytes / sessions / 1024 if memory_bytes is not None else None,
+        "chat_calls": fake_stats["chat_calls"],
+        "rate_limited": fake_stats["rate_limited"],
+        "summary_calls": fake_stats["summary_calls"],
+        "summary_prompt_chars_mean": sum(summary_chars) / len(summary_chars) if summary_chars else None,
+        "summary_prompt_chars_max": max(summary_chars) if summary_chars else None,
+        "first_summary_at_messages": first_summary_at,
+    }
+
+
+def latest_result(kind):
+    """bench/results/에서 kind(예: "load", "cold_start") 종류의 가장 최근 결과 파일"""
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, f"{kind}-*.json")))
+    return paths[-1] if paths else None
+
+
+def load_previous(kind, compare_path=None):
+    """비교할 이전 결과의 summary (compare_path가 없으면 같은 종류의 가장 최근 결과)"""
+    compare_path = compare_path or latest_result(kind)
+    if not compare_path:
+        return None
+    with open(compare_path, encoding="utf-8") as f:
+        previous = json.load(f)["summary"]
+    print(f"비교 대상: {compare_path}")
+    return previous
+
+
+def save_result(kind, config, summary, **details):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    result_path = os.path.join(RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "git_commit": git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": config,
+            "summary": summary,
+            **details,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"저장: {result_path}")
+
+
+def print_report(summary, previous=None, compared_metrics=COMPARED_METRICS):
+    print(f"{'metric':<30}{'this run':>14}{'previous':>14}{'change':>10}")
+    for key, label, lower_is_better in compared_metrics:
+        value = summary.get(key)
+        before = previous.get(key) if previous else None
+        change = ""
+        if value is not None and before:
+            delta = (value - before) / before * 100
+            worse = delta > 0 if lower_is_better else delta < 0
+            change = f"{delta:+.1f}%" + (" !" if worse and abs(delta) >= 10 else "")
+        fmt = lambda v: "-" if v is None else (f"{v:.3f}" if isinstance(v, float) else str(v))
+        print(f"{label:<30}{fmt(value):>14}{fmt(before):>14}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="가짜 Gemini 백엔드로 gemini_chat.py 부하/성능 측정")
+    parser.add_argument("--sessions", type=int, default=4, help="동시에 대화하는 세션 수 (N)")
+    parser.add_argument("--turns", type=int, default=15, help="세션당 보낼 메시지 수 (M)")
+    parser.add_argument("--concurrency", type=int, default=None, help="동시에 실행할 세션 수 (기본: --sessions)")
+    parser.add_argument("--chunk-size", type=int, default=12, help="청크 하나의 글자 수")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="청크 사이 지연(초)")
+    parser.add_argument("--first-chunk-delay", type=float, default=0.3, help="첫 청크까지 지연(초)")
+    parser.add_argument("--reply-chars", type=int, default=600, help="답변 길이(글자 수)")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="N번째 채팅 요청마다 429 발생 (0: 안 함)")
+    parser.add_argument("--tag-every", type=int, default=4, help="N번째 답변마다 제어 태그 포함 (0: 안 함)")
+    parser.add_argument("--summary-delay", type=float, default=0.5, help="요약 호출 지연(초)")
+    parser.add_argument("--rpm", type=int, default=1000, help="앱 스케줄러의 분당 요청 한도")
+    parser.add_argument("--timeout", type=float, default=120, help="rerun 하나의 최대 시간(초)")
+    parser.add_argument("--no-memory", action="store_true", help="tracemalloc으로 메모리를 재지 않음 (더 빠름)")
+    parser.add_argument("--compare", help="비교할 이전 결과 파일 (기본: bench/results/의 가장 최근 파일)")
+    parser.add_argument("--no-save", action="store_true", help="결과를 저장하지 않음")
+    parser.add_argument("--seed-messages", help="긴 대화 모드: 미리 넣을 메시지 수 목록 (예: 50,500,5000)")
+    args = parser.parse_args()
+
+    fake_genai.CONFIG = fake_genai.FakeConfig(
+        chunk_size=args.chunk_size,
+        chunk_delay=args.chunk_delay,
+        first_chunk_delay=args.first_chunk_delay,
+        reply_chars=args.reply_chars,
+        rate_limit_every=args.rate_limit_every,
+        tag_every=args.tag_every,
+        summary_delay=args.summary_delay,
+    )
+    fake_genai.install()
+    install_payload_counter()
+    allow_concurrent_apptests()
+
+    missing = missing_assets()
+    if missing:
+        print(f"경고: 없는 이미지 파일 {missing} -> 앱이 해당 이미지를 건너뛰고 실행합니다.")
+
+    # 앱 설정: 저장소/로그는 임시 폴더에 두어서 실제 데이터와 섞이지 않도록
+    workdir = tempfile.mkdtemp(prefix="yael-bench-")
+    turn_log_path = os.path.join(workdir, "turns.jsonl")
+    store_path = os.path.join(workdir, "conversations.sqlite3")
+    os.environ.update({
+        "CONVERSATION_STORE_PATH": store_path,
+        "METRICS_LOG_PATH": turn_log_path,
+        "SESSION_ID_IN_URL": "1", # 미리 채운 세션을 ?sid=로 열기 위해
+        "REQUESTS_PER_MINUTE": str(args.rpm),
+    })
+    os.chdir(REPO_DIR) # 앱이 img/ 등 상대 경로를 쓰므로
+
+    if args.seed_messages:
+        sizes = [int(size) for size in args.seed_messages.split(",")]
+        summary, details = run_history_bench(sizes, args.turns, args.timeout, store_path, turn_log_path)
+        print_report(summary, load_previous("history", args.compare), history_metrics(sizes))
+        print(f"errors: {sum(value for key, value in summary.items() if key.endswith('_errors'))}")
+        if not args.no_save:
+            save_result("history", vars(args), summary, runs=details)
+        return
+
+    if not args.no_memory:
+        tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+
+    started = time.perf_counter()
+    concurrency = args.concurrency or args.sessions
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_session, i, args.turns, args.timeout) for i in range(args.sessions)]
+        turn_results = [r for future in futures for r in future.result()]
+    elapsed = time.perf_counter() - started
+
+    wait_for_summaries(settle_seconds=args.summary_delay + 1)
+    memory_bytes = None
+    if memory_before is not None:
+        memory_bytes = tracemalloc.get_traced_memory()[0] - memory_before
+        tracemalloc.stop()
+
+    session_ids = {r["session_id"] for r in turn_results}
+    turn_log = read_turn_log(turn_log_path, session_ids)
+    summary = summarize(turn_results, turn_log, fake_genai.STATS.snapshot(), memory_bytes, args.sessions)
+    summary["wall_seconds"] = elapsed
+    summary["missing_assets"] = missing
+
+    previous = load_previous("load", args.compare)
+    print_report(summary, previous)
+    print(f"errors: {summary['errors']}, chat calls: {summary['chat_calls']}, "
+          f"injected 429: {summary['rate_limited']}, first summary at: {summary['first_summary_at_messages']} messages")
+
+    if not args.no_save:
+        save_result("load", vars(args), summary, turns=turn_results, turn_log=turn_log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+스트리밍 화면 갱신 벤치마크: 예전의 청크마다 다시 그리는 루프와 StreamRenderer(모아서 다시 그리기)의 비교.
+
+같은 청크 스트림(가짜 백엔드와 같은 답변/청크 크기/청크 간격)을 두 방식에 똑같이 흘려보내고,
+placeholder 대신 스텁을 넣어서 다시 그린 횟수, 보낸 markdown 바이트 수, CPU 시간(time.process_time)을 잽니다.
+- old: 청크마다 full_response += chunk; placeholder.markdown(full_response + "▌") (user-009 이전 루프)
+- renderer: gemini_chat.py의 StreamRenderer를 그대로 사용 (앱을 실행하지 않고 클래스 정의만 읽어옴)
+- 스텁은 Streamlit처럼 markdown 호출마다 ForwardMsg를 만들어 직렬화합니다. (호출당 서버 쪽 비용 근사)
+  청크 사이 대기는 sleep이라 CPU 시간에는 들어가지 않습니다.
+
+결과는 bench/results/stream_render-<시각>.json 에 저장되고 직전 결과와 비교합니다.
+
+    python bench/stream_render_bench.py --reply-chars 3000
+"""
+import argparse
+import ast
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+from run_bench import APP_PATH, load_previous, percentile, print_report, save_result
+import fake_genai
+
+MODES = ["old", "renderer"]
+
+
+class PlaceholderStub:
+    """st.empty() 대신: markdown 호출 횟수와 보낸 바이트 수를 세고, Streamlit처럼 메시지를 직렬화합니다."""
+
+    def __init__(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        self._forward_msg = ForwardMsg
+        self.calls = 0
+        self.bytes_pushed = 0
+        self.wire_bytes = 0
+
+    def markdown(self, body):
+        msg = self._forward_msg()
+        msg.delta.new_element.markdown.body = body
+        self.calls += 1
+        self.bytes_pushed += len(body.encode("utf-8"))
+        self.wire_bytes += len(msg.SerializeToString())
+
+
+def load_stream_renderer():
+    """gemini_chat.py에서 StreamRenderer 클래스와 STREAM_* 상수만 꺼내 옵니다. (스크립트를 실행하지 않음)"""
+    with open(APP_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    nodes = [
+        node for node in tree.body
+        if (isinstance(node, ast.ClassDef) and node.name == "StreamRenderer")
+        or (isinstance(node, ast.Assign) and any(getattr(t, "id", "").startswith("STREAM_") for t in node.targets))
+    ]
+    namespace = {"time": time, "estimate_tokens": lambda text: len(text) // 2}
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), APP_PATH, "exec"), namespace)
+    return namespace["StreamRenderer"]
+
+
+def make_chunks(reply_chars, chunk_size):
+    reply = (fake_genai.REPLY_TEXT * (reply_chars // len(fake_genai.REPLY_TEXT) + 1))[:reply_chars]
+    return [reply[start:start + chunk_size] for start in range(0, len(reply), chunk_size)]
+
+
+def replay(mode, chunks, chunk_delay, stream_renderer):
+    """청크 스트림 하나를 재생하고 (스텁, CPU 시간, 걸린 시간)을 돌려줍니다."""
+    placeholder = PlaceholderStub()
+    started_cpu = time.process_time()
+    started = time.perf_counter()
+    if mode == "old":
+        full_response = ""
+        for chunk in chunks:
+            time.sleep(chunk_delay)
+            full_response += chunk
+            placeholder.markdown(full_response + "▌")
+        placeholder.markdown(full_response)
+    else:
+        renderer = stream_renderer(placeholder)
+        for chunk in chunks:
+            time.sleep(chunk_delay)
+            renderer.write(chunk)
+        renderer.finish()
+    return placeholder, time.process_time() - started_cpu, time.perf_counter() - started
+
+
+def main():
+    defaults = fake_genai.FakeConfig()
+    parser = argparse.ArgumentParser(description="청크마다 다시 그리기 vs StreamRenderer의 갱신 횟수/바이트/CPU 시간 비교")
+    parser.add_argument("--reply-chars", type=int, default=3000, help="답변 길이(글자 수)")
+    parser.add_argument("--chunk-size", type=int, default=defaults.chunk_size, help="청크 하나의 글자 수")
+    parser.add_argument("--chunk-delay", type=float, default=defaults.chunk_delay, help="청크 사이 간격(초)")
+    parser.add_argument("--repeat", type=int, default=5, help="방식별 반복 횟수 (CPU 시간은 중앙값)")
+    parser.add_argument("--compare", help="비교할 이전 결과 파일 (기본: 가장 최근 stream_render 결과)")
+    parser.add_argument("--no-save", action="store_true", help="결과를 저장하지 않음")
+    args = parser.parse_args()
+
+    stream_renderer = load_stream_renderer()
+    chunks = make_chunks(args.reply_chars, args.chunk_size)
+
+    summary = {"chunks": len(chunks)}
+    compared_metrics = []
+    for mode in MODES:
+        runs = [replay(mode, chunks, args.chunk_delay, stream_renderer) for _ in range(args.repeat)]
+        placeholder = runs[-1][0]
+        summary.update({
+            f"{mode}_repaints": placeholder.calls,
+            f"{mode}_bytes_pushed": placeholder.bytes_pushed,
+            f"{mode}_wire_bytes": placeholder.wire_bytes,
+            f"{mode}_cpu_seconds": percentile([cpu for _, cpu, _ in runs], 0.50),
+            f"{mode}_wall_seconds": percentile([wall for _, _, wall in runs], 0.50),
+        })
+        compared_metrics += [
+            (f"{mode}_repaints", f"{mode} repaints", True),
+            (f"{mode}_bytes_pushed", f"{mode} markdown bytes", True),
+            (f"{mode}_wire_bytes", f"{mode} ForwardMsg bytes", True),
+            (f"{mode}_cpu_seconds", f"{mode} CPU (s)", True),
+        ]
+
+    print(f"reply: {args.reply_chars} chars, {len(chunks)} chunks x {args.chunk_size} chars, {args.chunk_delay}s apart")
+    print_report(summary, load_previous("stream_render", args.compare), compared_metrics)
+    if not args.no_save:
+        save_result("stream_render", vars(args), summary)
+
+
+if __name__ == "__main__":
+    main()
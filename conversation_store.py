@@ -0,0 +1,233 @@
+"""
+대화 기록 저장소.
+
+전체 대화는 디스크(SQLite 또는 JSONL)에 저장하고, 서버 메모리에는 세션별로 최근 대화(hot tail)만 둡니다.
+장기 기억(요약본)과 watermark도 함께 저장하므로 서버가 재시작되어도 대화를 이어갈 수 있습니다.
+
+- SQLiteConversationStore: 기본 저장소 (파일 하나에 모든 세션)
+- JsonlConversationStore: 세션마다 append-only JSONL 파일 하나
+- ConversationCache: 세션별 hot tail을 메모리에 들고 있다가, 오래 쓰지 않은 세션은 메모리에서 내립니다.
+  같은 대화 id를 여러 브라우저 탭(Streamlit 세션)이 열면 같은 Conversation을 함께 쓰므로, 추가/읽기는 락 안에서 합니다.
+
+저장소는 모두 같은 메서드(append / count / load / save_memory / load_memory)를 가지므로
+다른 저장소(예: Redis, Postgres)도 같은 형태로 만들어 open_store()에 추가하면 됩니다.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SQLiteConversationStore:
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 백그라운드 요약 스레드에서도 쓰므로 연결 하나를 락으로 보호해서 공유
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " session_id TEXT NOT NULL, idx INTEGER NOT NULL, data TEXT NOT NULL,"
+                " PRIMARY KEY (session_id, idx))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS memory ("
+                " session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, watermark INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def append(self, session_id, message):
+        """메시지를 맨 뒤에 추가하고 그 메시지의 번호(0부터)를 돌려줍니다."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+            index = row[0]
+            self._conn.execute(
+                "INSERT INTO messages (session_id, idx, data) VALUES (?, ?, ?)",
+                (session_id, index, json.dumps(message, ensure_ascii=False)),
+            )
+        return index
+
+    def count(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0]
+
+    def load(self, session_id, start, end):
+        """start번 ~ end-1번 메시지 목록"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM messages WHERE session_id = ? AND idx >= ? AND idx < ? ORDER BY idx",
+                (session_id, start, end),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def save_memory(self, session_id, summary, watermark):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO memory (session_id, summary, watermark, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, summary, watermark, time.time()),
+            )
+
+    def load_memory(self, session_id):
+        """(요약본, watermark). 저장된 게 없으면 ("", 0)"""
+        with self._lock:
+            row = self._conn.execute("SELECT summary, watermark FROM memory WHERE session_id = ?", (session_id,)).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+
+
+class JsonlConversationStore:
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._counts = {} # 세션 id -> 메시지 수 (매번 파일을 세지 않도록)
+
+    def _messages_path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.jsonl")
+
+    def _memory_path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.memory.json")
+
+    def _read_all(self, session_id):
+        path = self._messages_path(session_id)
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def append(self, session_id, message):
+        with self._lock:
+            index = self._count_locked(session_id)
+            with open(self._messages_path(session_id), "a", encoding="utf-8") as f:
+                f.write(json.dumps(message, ensure_ascii=False) + "\n")
+            self._counts[session_id] = index + 1
+        return index
+
+    def _count_locked(self, session_id):
+        if session_id not in self._counts:
+            self._counts[session_id] = len(self._read_all(session_id))
+        return self._counts[session_id]
+
+    def count(self, session_id):
+        with self._lock:
+            return self._count_locked(session_id)
+
+    def load(self, session_id, start, end):
+        with self._lock:
+            return self._read_all(session_id)[start:end]
+
+    def save_memory(self, session_id, summary, watermark):
+        path = self._memory_path(session_id)
+        with self._lock:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"summary": summary, "watermark": watermark}, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+
+    def load_memory(self, session_id):
+        path = self._memory_path(session_id)
+        with self._lock:
+            if not os.path.exists(path):
+                return ("", 0)
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        return (data["summary"], data["watermark"])
+
+
+def open_store(kind, path):
+    """kind: "sqlite"(기본) 또는 "jsonl" """
+    if kind == "jsonl":
+        return JsonlConversationStore(path)
+    return SQLiteConversationStore(path)
+
+
+class Conversation:
+    """한 세션의 대화. 전체 기록은 저장소에 있고, 메모리에는 최근 hot_tail_size개만 둡니다."""
+
+    def __init__(self, store, session_id, hot_tail_size):
+        self.store = store
+        self.session_id = session_id
+        self.hot_tail_size = hot_tail_size
+        self._lock = threading.Lock()
+        self.total = store.count(session_id)
+        self.offset = max(self.total - hot_tail_size, 0) # messages[0]의 전체 기준 번호
+        self.messages = store.load(session_id, self.offset, self.total)
+        self.last_seen = time.monotonic()
+        self.summary_job = None # 이 대화의 백그라운드 요약 작업 (같은 대화를 연 세션들이 하나를 함께 씀)
+
+    def append(self, message):
+        with self._lock:
+            self.store.append(self.session_id, message)
+            self.messages.append(message)
+            self.total += 1
+            # hot tail 크기를 넘으면 앞에서부터 버림 (저장소에는 남아 있음)
+            overflow = len(self.messages) - self.hot_tail_size
+            if overflow > 0:
+                del self.messages[:overflow]
+                self.offset += overflow
+
+    def load(self, start, end):
+        """전체 기준 start ~ end-1번 메시지. hot tail에 없는 부분만 저장소에서 읽어옵니다."""
+        with self._lock:
+            start = max(start, 0)
+            end = min(end, self.total)
+            if start >= self.offset:
+                return self.messages[start - self.offset:end - self.offset]
+            older = self.store.load(self.session_id, start, min(end, self.offset))
+            return older + self.messages[:max(end - self.offset, 0)]
+
+    def start_summary_job(self, submit):
+        """실행 중인 요약 작업이 없으면 submit()으로 시작합니다. (여러 세션이 동시에 불러도 하나만 시작)"""
+        with self._lock:
+            if self.summary_job is not None and not self.summary_job.done():
+                return False
+            self.summary_job = submit()
+            return True
+
+
+class ConversationCache:
+    """세션별 Conversation을 메모리에 들고 있다가 idle_timeout초 동안 안 쓰인 세션은 메모리에서 내립니다."""
+
+    def __init__(self, store, hot_tail_size=200, idle_timeout=30 * 60, sweep_interval=60):
+        self.store = store
+        self.hot_tail_size = hot_tail_size
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._conversations = {}
+        self._last_sweep = time.monotonic()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep > self.sweep_interval:
+                self._sweep(now)
+
+            conversation = self._conversations.get(session_id)
+            if conversation is None:
+                # 처음이거나 메모리에서 내려간 세션 -> 저장소에서 최근 대화만 다시 읽음
+                conversation = Conversation(self.store, session_id, self.hot_tail_size)
+                self._conversations[session_id] = conversation
+            conversation.last_seen = now
+            return conversation
+
+    def forget(self, session_id):
+        with self._lock:
+            self._conversations.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._conversations),
+                "hot_messages": sum(len(c.messages) for c in self._conversations.values()),
+            }
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        idle = [
+            sid for sid, c in self._conversations.items()
+            if now - c.last_seen > self.idle_timeout and (c.summary_job is None or c.summary_job.done())
+        ]
+        for session_id in idle:
+            del self._conversations[session_id]
@@ -1,11 +1,302 @@
+import time
+rerun_started = time.perf_counter() # 이번 rerun 소요 시간 측정용
+
 import streamlit as st
-import google.generativeai as genai
 import os
 import base64
-import time
+import itertools
+import mimetypes
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from google.api_core.exceptions import ResourceExhausted
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import assets
+import conversation_store
+import metrics
+import model_pool
+import response_cache
+import scheduler
+import token_budget
+
+# --- 공통 설정 (인트로 화면에서 미리 준비 작업을 시작하기 위해 맨 위에 둡니다) ---
+MODEL_NAME = "models/gemini-flash-lite-latest" # 기본 모델
+
+# 장기 기억(요약) 설정
+SUMMARY_BATCH_SIZE = 6    # 윈도우 밖으로 밀려난 메시지가 이만큼 쌓일 때마다 한 번씩 요약
+SUMMARY_MAX_TOKENS = 512  # 요약본 자체의 최대 길이 (토큰)
+SUMMARY_WORKERS = 2       # 요약 작업 전용 스레드 수
+# 요약 한 번에 넣는 밀린 대화의 상한 (밀린 대화가 많으면 여러 번에 나눠서 요약하고, watermark도 넣은 만큼만 옮김)
+SUMMARY_MAX_INPUT_MESSAGES = 40
+SUMMARY_MAX_INPUT_TOKENS = 3000 # 추정 토큰 수 (token_budget.estimate_raw_tokens)
+SUMMARY_MESSAGE_MAX_CHARS = 1500 # 긴 붙여넣기 등은 앞부분만 요약에 넣음
+
+# 설정이 같은 GenerativeModel을 재사용하는 풀의 최대 크기 (요약이 다른 세션마다 모델이 하나씩 필요)
+MODEL_POOL_SIZE = 64
+
+# 대화 저장소: 전체 기록은 디스크에, 서버 메모리에는 세션별로 최근 HOT_TAIL_SIZE개만 둡니다.
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "sqlite") # "sqlite" 또는 "jsonl"
+CONVERSATION_STORE_PATH = os.getenv(
+    "CONVERSATION_STORE_PATH",
+    "data/conversations.sqlite3" if CONVERSATION_STORE == "sqlite" else "data/conversations",
+)
+HOT_TAIL_SIZE = 200                   # 세션 메모리에 남겨둘 최근 메시지 수
+SESSION_IDLE_TIMEOUT = 30 * 60        # 초: 이 시간 동안 활동이 없으면 메모리에서 내림 (저장소에는 남음)
+# 1이면 대화 id를 주소창의 ?sid=...에 넣어서 새로고침/서버 재시작 뒤에도 같은 대화를 이어갑니다.
+# 주소를 아는 사람은 누구나 그 대화를 볼 수 있으므로(주소 공유, 브라우저 기록 등) 기본은 꺼 둡니다.
+SESSION_ID_IN_URL = os.getenv("SESSION_ID_IN_URL", "0") == "1"
+
+# API 요청 한도 (프로세스 전체 공유). 사용하는 요금제의 한도에 맞춰 조정하세요.
+REQUESTS_PER_MINUTE = int(os.getenv("REQUESTS_PER_MINUTE", "15"))
+TOKENS_PER_MINUTE = int(os.getenv("TOKENS_PER_MINUTE", "250000"))
+
+# 응답 캐시 (선택 기능): 환경변수 RESPONSE_CACHE=1 일 때만 사용
+# 대화 초반처럼 최근 대화가 RESPONSE_CACHE_MAX_HISTORY개 이하일 때만 캐시를 쓰고, 그 이상이면 항상 모델에 물어봅니다.
+# (앞선 대화도 키에 들어가므로, 두 번째 질문의 답변은 첫 질문과 답변까지 같을 때만 재사용)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_MAX_HISTORY = 2
+RESPONSE_CACHE_TTL = 60 * 60         # 초
+RESPONSE_CACHE_MAX_BYTES = 2_000_000 # 캐시 전체 최대 크기
+
+# 측정/관리자 화면
+METRICS_LOG_PATH = os.getenv("METRICS_LOG_PATH", "logs/turns.jsonl") # 턴별 측정값 (크기 기준 자동 교체)
+METRICS_PORT = os.getenv("METRICS_PORT")  # 지정하면 http://<서버>:<포트>/metrics 로 Prometheus 형식 제공
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")    # 지정하면 ?admin=<토큰> 으로 관리자 화면 접속
+INPUT_PRICE_PER_MILLION = float(os.getenv("INPUT_PRICE_PER_MILLION", "0.10"))   # 입력 토큰 100만 개당 비용(USD)
+OUTPUT_PRICE_PER_MILLION = float(os.getenv("OUTPUT_PRICE_PER_MILLION", "0.40")) # 출력 토큰 100만 개당 비용(USD)
+
+# 첫 채팅 화면에서 인트로 동안의 준비 작업을 기다리는 최대 시간 (초). 넘으면 기다리지 않고 새로 준비합니다.
+WARMUP_TIMEOUT = 3
+
+# 컨텍스트 설정: 시스템 프롬프트 + 장기 기억 + 최근 대화 + 이번 메시지를 합친 입력 토큰 예산
+CONTEXT_TOKEN_BUDGET = 6000
+
+base_instruction = (
+    "너의 이름은 '야엘 슈브'야. 직업은 메이드장이면서 카페의 지배인이야. "
+    "사용자를 지칭할때는 손님이라고 불러줘. 사용자에게 도움을 주긴 하지만, "
+    "말투는 기본적으로 '~해요', '~군요', '~인가요?' 식의 나긋나긋하고 격식 있는 존댓말로 해줘. "
+    "하지만 사용자의 약점이나 욕심을 발견하면 말줄임표(...)와 감탄사(하아, 으윽, 멋져요..!)를 섞어 흥분 상태를 표현해주고 "
+    "논리보다는 감정과 쾌락을 우선시하는 단어를 선택해줘. "
+    "예를 들면 '운, 리스크, 파멸, 쾌락, 내기, 전부, 미쳐버릴 것 같은' 같은 말을 자주 섞어서 사용해줘."
+    "이 카페의 이름은 '우이메카 카페'야."
+    "메뉴판의 내용은 에스프레소(2000원), 아메리카노(3000원), 카페라떼(4000원), 카푸치노(5000원)야."
+    "[중요: 이미지 출력 규칙]"
+    "대화 도중 손님이 '메뉴판', '가격표', '차림표' 등을 직접적으로 보여달라고 요청할 때만, 답변의 맨 마지막에 반드시 `{{SHOW_MENU}}` 라는 태그를 붙여줘."
+    "그 외의 상황(메뉴 추천 요청 등)에서는 붙이지 마."
+    "메뉴를 주문하면 사은품으로 야엘의 그림을 한개 선물해 주는 이벤트 중이야. 이 때에는 답변의 맨 마지막에 반드시 `{{YAEL2}}` 라는 태그를 붙여줘."
+)
+
+def build_instruction(summary):
+    """기본 시스템 프롬프트에 장기 기억(요약본)을 붙여서 돌려줍니다."""
+    if not summary:
+        return base_instruction
+    return base_instruction + f"\n\n[기억된 과거 대화 요약]: {summary}\n이 기억을 바탕으로 대화를 이어가."
+
+# --- Google SDK (필요할 때 import) ---
+# google.generativeai / google.api_core는 import하는 데만 1초 가까이 걸리므로 인트로 화면에서는 불러오지 않고,
+# 인트로 동안 도는 워밍업 스레드나 채팅 화면에서 처음 필요할 때 불러옵니다. (이후에는 sys.modules에서 바로 반환)
+def load_genai():
+    import google.generativeai as genai
+    return genai
+
+def resource_exhausted_error():
+    """429 에러의 예외 클래스 (except 절에서 사용)"""
+    from google.api_core.exceptions import ResourceExhausted
+    return ResourceExhausted
+
+def build_safety_settings():
+    # 안전 설정: 모든 필터를 "BLOCK_NONE" (차단 안 함)으로 설정
+    from google.generativeai.types import HarmCategory, HarmBlockThreshold
+    return {
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
+
+def resolve_api_key():
+    """secrets.toml -> 환경변수(.env) 순서로 API 키를 찾습니다. 없으면 None."""
+    # 1. 환경 변수 로드
+    load_dotenv()
+
+    # --- API 키 설정 (로컬/배포 호환성 확보) ---
+    api_key = None
+
+    try:
+        # 로컬에 secrets.toml이 없어도 에러가 나지 않도록 예외 처리
+        if "GOOGLE_API_KEY" in st.secrets:
+            api_key = st.secrets["GOOGLE_API_KEY"]
+    except (FileNotFoundError, KeyError):
+        pass
+
+    # secrets에 없으면 환경변수 확인
+    if not api_key:
+        api_key = os.getenv("GOOGLE_API_KEY")
+
+    return api_key
+
+# .env 로드 / secrets 확인 / genai.configure(ModelPool.configure)는 rerun마다 할 필요가 없으므로 프로세스당 한 번만 합니다.
+# (키를 바꾸면 서버를 재시작하세요)
+@st.cache_resource
+def get_api_key():
+    return resolve_api_key()
+
+@st.cache_resource
+def get_metrics():
+    # 프로세스 전체의 측정값 모음 (턴별 JSONL 로그 + Prometheus 카운터/히스토그램)
+    registry = metrics.MetricsRegistry(log_path=METRICS_LOG_PATH)
+    if METRICS_PORT:
+        try:
+            metrics.start_http_exporter(registry, int(METRICS_PORT))
+        except OSError as e:
+            print(f"메트릭 서버 시작 실패: {e}")
+    return registry
+
+def estimate_cost(input_tokens, output_tokens):
+    return (input_tokens or 0) / 1_000_000 * INPUT_PRICE_PER_MILLION + (output_tokens or 0) / 1_000_000 * OUTPUT_PRICE_PER_MILLION
+
+@st.cache_resource
+def get_background_executor():
+    # 모든 세션이 함께 쓰는 백그라운드 작업용 스레드 풀 (프로세스당 1개만 생성)
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="yael-bg")
+
+@st.cache_resource
+def get_summary_executor():
+    # 요약 작업 전용 스레드 풀 (요약이 밀려도 영상 변환/워밍업 스레드를 차지하지 않도록)
+    return ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="yael-summary")
+
+@st.cache_resource
+def get_warmup_executor():
+    # 인트로 동안의 모델 준비 전용 스레드 풀
+    # (영상 변환이나 요약 작업이 다른 풀을 차지하고 있어도 새 방문자의 준비가 밀리지 않도록 따로 둡니다)
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="yael-warmup")
+
+# --- 경량 에셋 선택 (표시 크기 이미지 / 가벼운 인트로 영상) ---
+def _build_image_variant(path, width, registry):
+    started = time.perf_counter()
+    variant = assets.build_image_variant(path, width)
+    registry.observe("asset_encode_seconds", time.perf_counter() - started)
+    return variant
+
+@st.cache_resource(max_entries=64)
+def start_image_variant_build(path, width, mtime):
+    # 이미지 변환은 수백 ms 걸릴 수 있으므로 답변 스트리밍 중에 하지 않고 프로세스당 한 번만 백그라운드에서 실행
+    return get_background_executor().submit(_build_image_variant, path, width, get_metrics())
+
+def sized_image(path, width):
+    """st.image / 아바타에 쓸, 표시 크기에 맞는 경량 이미지 경로를 돌려줍니다. (아직 없으면 변환을 시작하고 원본 경로)"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return path # 원본이 없으면 기존처럼 st.image가 에러를 내도록 그대로 전달
+    variant = assets.image_variant(path, width)
+    if variant is None:
+        start_image_variant_build(path, width, mtime)
+        return path
+    return variant
+
+@st.cache_resource
+def start_video_variant_build(path, mtime):
+    # 영상 변환은 몇 초 걸리므로 프로세스당 한 번만 백그라운드에서 실행
+    return get_background_executor().submit(assets.build_video_variant, path)
+
+def intro_video(path):
+    """경량 인트로 영상이 준비되어 있으면 그 경로를, 아니면 변환을 시작하고 원본 경로를 돌려줍니다."""
+    variant = assets.video_variant(path)
+    if variant == path and os.path.exists(path):
+        start_video_variant_build(path, os.path.getmtime(path))
+    return variant
+
+@st.cache_resource
+def get_request_scheduler():
+    # 모든 세션의 API 요청이 이 스케줄러 하나를 거쳐서 나갑니다. (분당 한도 공유 + 429 재시도)
+    return scheduler.RequestScheduler(
+        REQUESTS_PER_MINUTE,
+        TOKENS_PER_MINUTE,
+        retry_on=lambda: (resource_exhausted_error(),), # 429 예외 클래스는 처음 필요할 때 import
+    )
+
+@st.cache_resource
+def get_response_cache():
+    # 프로세스 전체에서 공유하는 응답 캐시
+    return response_cache.ResponseCache(ttl=RESPONSE_CACHE_TTL, max_bytes=RESPONSE_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_conversation_store():
+    return conversation_store.open_store(CONVERSATION_STORE, CONVERSATION_STORE_PATH)
+
+@st.cache_resource
+def get_conversation_cache():
+    # 세션별 최근 대화(hot tail)를 들고 있는 프로세스 전역 캐시
+    return conversation_store.ConversationCache(
+        get_conversation_store(),
+        hot_tail_size=HOT_TAIL_SIZE,
+        idle_timeout=SESSION_IDLE_TIMEOUT,
+    )
+
+@st.cache_resource
+def get_model_pool():
+    # 설정이 같은 GenerativeModel을 프로세스 전체에서 재사용 (세션은 start_chat()만 따로)
+    return model_pool.ModelPool(MODEL_NAME, build_safety_settings, max_size=MODEL_POOL_SIZE)
+
+@st.cache_resource
+def register_metric_collectors():
+    # 스케줄러(429 횟수 등) / 응답 캐시 / 모델 풀 / 대화 캐시 상태를 Prometheus gauge로 함께 내보냄 (한 번만 등록)
+    registry = get_metrics()
+    registry.add_collector(lambda: {f"scheduler_{k}": v for k, v in get_request_scheduler().stats().items()})
+    registry.add_collector(lambda: {f"response_cache_{k}": v for k, v in get_response_cache().stats().items()})
+    registry.add_collector(lambda: {f"model_pool_{k}": v for k, v in get_model_pool().stats().items()})
+    registry.add_collector(lambda: {f"conversation_cache_{k}": v for k, v in get_conversation_cache().stats().items()})
+    return True
+
+register_metric_collectors()
+
+def warm_up_chat(api_key, instruction, model_pool, request_scheduler, executor):
+    """
+    인트로 영상이 나오는 동안 백그라운드에서 모델과 채팅 세션을 미리 준비합니다.
+    첫 메시지를 보낼 때 연결 준비 시간까지 기다리지 않도록 transport도 미리 열어두지만,
+    그건 한도가 빠듯하면 스케줄러에서 기다릴 수 있으므로 따로 맡겨두고 모델/세션은 바로 돌려줍니다.
+    """
+    model_pool.configure(api_key) # 인트로 화면 대신 이 스레드에서 SDK를 처음 import
+    model = model_pool.get(instruction)
+    chat_session = model.start_chat(history=[])
+    # 연결 준비도 API 호출이므로 스케줄러를 거침 (세션 id가 아직 없으므로 모든 워밍업을 한 줄로 취급)
+    executor.submit(
+        model_pool.warm_up, model, instruction, request_scheduler=request_scheduler, session_id="warm-up"
+    )
+
+    return model, chat_session
+
+# --- 관리자 화면 (?admin=<ADMIN_TOKEN>) ---
+def render_admin_page():
+    st.set_page_config(layout="wide", page_title="우이메카 - 관리자")
+    st.title("📊 우이메카 카페 측정값")
+
+    registry = get_metrics()
+    st.subheader("지연 시간 / 처리량 (최근 값 기준 백분위)")
+    st.dataframe(registry.summary(), use_container_width=True)
+
+    st.subheader("세션별 사용량 / 비용 (USD)")
+    session_rows = [{"session_id": sid, **usage} for sid, usage in registry.sessions.items()]
+    st.dataframe(sorted(session_rows, key=lambda row: -row["cost"]), use_container_width=True)
+
+    st.subheader("API / 캐시 / 풀 상태")
+    st.json({
+        "scheduler": get_request_scheduler().stats(),
+        "response_cache": get_response_cache().stats(),
+        "model_pool": get_model_pool().stats(),
+        "conversations": get_conversation_cache().stats(),
+    })
+
+    prometheus_text = registry.render_prometheus()
+    st.download_button("Prometheus 형식으로 내려받기", prometheus_text, file_name="metrics.txt")
+    with st.expander("Prometheus 원문"):
+        st.code(prometheus_text)
+
+if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN:
+    render_admin_page()
+    st.stop()
 
 # --- 0. 인트로 상태 초기화 ---
 if "intro_watched" not in st.session_state:
@@ -15,6 +306,15 @@ if "intro_watched" not in st.session_state:
 if not st.session_state.intro_watched:
     # 화면을 꽉 채우기 위해 빈 컨테이너 사용 (선택 사항)
     st.set_page_config(layout="centered", page_title="우이메카 - 접속 중...")
+
+    # 영상이 나오는 동안 모델/채팅 세션 준비를 백그라운드에서 시작 (세션당 한 번)
+    if "warmup" not in st.session_state:
+        warmup_key = get_api_key()
+        if warmup_key:
+            st.session_state.warmup = get_warmup_executor().submit(
+                warm_up_chat, warmup_key, base_instruction, get_model_pool(), get_request_scheduler(),
+                get_warmup_executor(),
+            )
     
     # 제목이나 로고
     # st.title("🎬 Prologue")
@@ -26,7 +326,8 @@ if not st.session_state.intro_watched:
     # 1. 영상 재생
     # autoplay=True: 자동 재생
     # muted=True: 브라우저 정책상 소리를 꺼야 자동 재생이 잘 됩니다. (소리가 켜져 있으면 브라우저가 막을 수 있음)
-    st.video(VIDEO_PATH, autoplay=True, muted=True)
+    # (경량 버전이 준비되어 있으면 그걸 사용)
+    st.video(intro_video(VIDEO_PATH), autoplay=True, muted=True)
     
     # 2. 스킵 버튼 (기다리기 지루한 사람을 위해)
     st.write("") # 영상과 버튼 사이 여백 조금 추가
@@ -42,209 +343,326 @@ if not st.session_state.intro_watched:
             st.session_state.intro_watched = True
             st.rerun()
 
-    # 3. 영상 길이만큼 대기 (서버가 잠시 멈춤)
-    # 영상 로딩 시간을 고려해 1~2초 정도 여유를 주는 게 좋습니다.
-    time.sleep(VIDEO_LENGTH)
-    
-    # 4. 시간이 지나면 자동으로 상태 변경 후 리로딩
-    st.session_state.intro_watched = True
-    st.rerun() # 화면 새로고침 -> 메인 화면으로 진입
+    # 3. 영상 길이만큼 기다렸다가 자동으로 넘어가기
+    # time.sleep()으로 기다리면 방문자마다 서버 스레드가 VIDEO_LENGTH초씩 묶여버립니다.
+    # 대신 시작 시각만 기록해두고, 1초마다 다시 실행되는 작은 fragment가 경과 시간을 확인합니다.
+    # (fragment 재실행은 이 함수만 다시 돌기 때문에 스크립트 스레드를 붙잡지 않습니다.)
+    if "intro_started_at" not in st.session_state:
+        st.session_state.intro_started_at = time.time()
 
-# 1. 환경 변수 로드
-load_dotenv()
+    @st.fragment(run_every=1)
+    def intro_timer():
+        # 4. 시간이 지나면 자동으로 상태 변경 후 리로딩
+        # 영상 로딩 시간을 고려해 1~2초 정도 여유를 주는 게 좋습니다.
+        if time.time() - st.session_state.intro_started_at >= VIDEO_LENGTH:
+            st.session_state.intro_watched = True
+            st.rerun() # 화면 새로고침 -> 메인 화면으로 진입
 
-# --- API 키 설정 (로컬/배포 호환성 확보) ---
-api_key = None
+    intro_timer()
 
-try:
-    # 로컬에 secrets.toml이 없어도 에러가 나지 않도록 예외 처리
-    if "GOOGLE_API_KEY" in st.secrets:
-        api_key = st.secrets["GOOGLE_API_KEY"]
-except (FileNotFoundError, KeyError):
-    pass
+    # 인트로 화면에서는 여기서 실행을 끝냅니다. (아래 채팅 화면은 그리지 않음)
+    st.stop()
 
-# secrets에 없으면 환경변수 확인
-if not api_key:
-    api_key = os.getenv("GOOGLE_API_KEY")
+# 1. API 키 확인 (secrets.toml -> .env 순서)
+api_key = get_api_key()
 
 # 최종 API 키 확인
 if api_key:
-    genai.configure(api_key=api_key)
+    get_model_pool().configure(api_key) # 워밍업 스레드가 이미 설정했으면 다시 하지 않음
 else:
+    get_api_key.clear() # 키를 추가한 뒤 새로고침하면 다시 찾도록 "키 없음"은 캐시하지 않음
     st.error("API 키를 찾을 수 없습니다. .env 파일이나 Streamlit Secrets를 확인해주세요.")
     st.stop()
 
 # --- 세션 상태 초기화 (에러 방지 로직 포함) ---
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# 세션(대화) id: SESSION_ID_IN_URL이 켜져 있으면 주소창의 ?sid=... 에도 넣어 두어서,
+# 새로고침하거나 서버가 재시작되어도 같은 대화를 이어갑니다. (꺼져 있으면 브라우저 세션마다 새 대화)
+if "session_id" not in st.session_state:
+    sid = st.query_params.get("sid", "") if SESSION_ID_IN_URL else ""
+    if len(sid) != 32 or not all(ch in "0123456789abcdef" for ch in sid):
+        sid = uuid.uuid4().hex
+    st.session_state.session_id = sid
+    if SESSION_ID_IN_URL:
+        st.query_params["sid"] = sid
+
+    # [추가] 장기 기억(요약본)과 watermark(요약에 반영된 메시지 개수)는 저장소에서 복원
+    st.session_state.long_term_memory, st.session_state.summary_watermark = (
+        get_conversation_store().load_memory(sid)
+    )
 
-# [추가] 장기 기억(요약본)을 저장할 변수
-if "long_term_memory" not in st.session_state:
-    st.session_state.long_term_memory = "" 
+# --- 이미지 에셋 (프로세스당 한 번만 읽고, 가능하면 정적 URL로 서빙) ---
+# 매 rerun마다 파일을 읽어 base64로 인코딩하면 디스크 I/O + 약 1MB 인코딩 + 약 1MB 전송이 매 턴 발생합니다.
+# .streamlit/config.toml의 enableStaticServing이 켜져 있으면 static/ 폴더로 복사해서
+# 브라우저가 캐시할 수 있는 고정 URL(app/static/...)로 내려주고, 꺼져 있으면 base64를 한 번만 만들어 재사용합니다.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
 
-def get_img_as_base64(file_path):
+@st.cache_resource(max_entries=32)
+def get_img_as_base64(file_path, mtime=None):
+    # mtime을 캐시 키에 포함해서 파일이 바뀌면 다시 인코딩합니다.
+    started = time.perf_counter()
     with open(file_path, "rb") as f:
         data = f.read()
-    return base64.b64encode(data).decode()
+    encoded = base64.b64encode(data).decode()
+    get_metrics().observe("asset_encode_seconds", time.perf_counter() - started)
+    return encoded
+
+@st.cache_resource(max_entries=32)
+def publish_static_asset(file_path, mtime):
+    """파일을 static/ 폴더로 복사하고 캐시 가능한 URL을 돌려줍니다. (경로+mtime당 한 번만 실행)"""
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    file_name = os.path.basename(file_path)
+    shutil.copy2(file_path, os.path.join(STATIC_DIR, file_name))
+    # 파일이 바뀌면 URL도 바뀌도록 mtime을 버전으로 붙임
+    return f"app/static/{file_name}?v={int(mtime)}"
+
+def asset_src(file_path):
+    """<img src> / CSS url()에 넣을 주소를 돌려줍니다. (정적 URL 우선, 안 되면 data URI)"""
+    mtime = os.path.getmtime(file_path)
+    if st.get_option("server.enableStaticServing"):
+        return publish_static_asset(file_path, mtime)
+
+    mime_type = mimetypes.guess_type(file_path)[0] or "image/png"
+    return f"data:{mime_type};base64,{get_img_as_base64(file_path, mtime)}"
 
 # --- [신규 기능] 대화 요약 함수 ---
-def summarize_old_conversations(full_history, current_summary, window_size=20):
+def summarize_old_conversations(new_messages, current_summary, watermark, evicted_end, batch_size=None,
+                                request_scheduler=None, session_id=None, model_pool=None, metrics_registry=None,
+                                call_stats=None):
     """
-    윈도우 밖으로 밀려난 대화가 있다면 요약하여 long_term_memory를 업데이트합니다.
-    매번 API를 호출하면 느리므로, 윈도우 밖 데이터가 일정량(예: 5개) 쌓였을 때만 실행하는 것이 좋습니다.
-    여기서는 개념 이해를 위해 '윈도우 밖 데이터 전체'를 요약하는 로직으로 구성합니다.
+    윈도우 밖으로 밀려난 대화 중 '아직 요약에 반영되지 않은 부분'만 기존 요약에 덧붙여 요약합니다.
+    watermark는 전체 대화 앞쪽에서 이미 long_term_memory에 반영된 메시지 개수이고,
+    evicted_end는 토큰 예산 때문에 컨텍스트에서 빠진 구간의 끝입니다.
+    new_messages는 전체 대화의 [watermark:evicted_end] 구간입니다.
+    매번 API를 호출하면 느리므로, 새로 밀려난 대화가 batch_size개 이상 쌓였을 때만 실행합니다.
+    한 번에는 앞에서부터 SUMMARY_MAX_INPUT_MESSAGES개 / SUMMARY_MAX_INPUT_TOKENS 토큰까지만 요약하고
+    watermark도 그만큼만 옮깁니다. (나머지는 다음 작업에서 이어서 요약)
+    request_scheduler를 주면 채팅보다 낮은 우선순위로 요청 스케줄러를 거쳐서 호출하고,
+    model_pool을 주면 요약용 모델도 풀에서 재사용하고, metrics_registry를 주면 호출 시간/토큰을 기록합니다.
+    call_stats(dict)를 주면 이번 호출의 시간/토큰 수를 채워 넣습니다. (턴별 기록용)
+    반환값: (새 요약, 새 watermark) - 요약하지 않았거나 실패하면 기존 값을 그대로 돌려줍니다.
     """
-    # 전체 대화 개수
-    total_len = len(full_history)
-    
-    # 윈도우 사이즈보다 대화가 적으면 요약할 필요 없음
-    if total_len <= window_size:
-        return current_summary
-    
-    # 윈도우 밖으로 밀려난 오래된 대화들 추출 (전체 - 최근 20개)
-    # 이미 요약된 부분은 제외하고 '새로 밀려난 부분'만 요약하면 더 좋지만, 
-    # 구현의 단순화를 위해 '오래된 대화 전체'를 재요약하거나 
-    # 기존 요약 + 밀려난 대화 -> 새 요약 방식으로 진행합니다.
-    
-    old_messages = full_history[:-window_size]
-    
-    # 요약을 위한 텍스트 변환
+    if batch_size is None:
+        batch_size = SUMMARY_BATCH_SIZE
+
+    # 새로 밀려난 대화가 충분히 쌓이지 않았으면 다음 기회에 한꺼번에 요약
+    if len(new_messages) < batch_size:
+        return current_summary, watermark
+
+    # 요약을 위한 텍스트 변환 (입력 상한까지만, 최소 1개는 넣어서 watermark가 항상 앞으로 가도록)
     conversation_text = ""
-    for msg in old_messages:
+    input_tokens_estimate = 0
+    included = 0
+    for msg in new_messages[:SUMMARY_MAX_INPUT_MESSAGES]:
         role = "손님" if msg["role"] == "user" else "야엘"
-        conversation_text += f"{role}: {msg['content']}\n"
+        content = msg["content"]
+        if len(content) > SUMMARY_MESSAGE_MAX_CHARS:
+            content = content[:SUMMARY_MESSAGE_MAX_CHARS] + "...(생략)"
+        line = f"{role}: {content}\n"
+        line_tokens = token_budget.estimate_raw_tokens(line)
+        if included and input_tokens_estimate + line_tokens > SUMMARY_MAX_INPUT_TOKENS:
+            break
+        conversation_text += line
+        input_tokens_estimate += line_tokens
+        included += 1
+    evicted_end = watermark + included
 
-    # 요약 프롬프트
+    # 요약 프롬프트 (요약본 자체의 길이도 제한해서 프롬프트가 계속 커지지 않게 함)
     summary_prompt = (
         f"이전 요약 내용: {current_summary}\n\n"
         f"추가된 오래된 대화:\n{conversation_text}\n\n"
         "위 내용을 바탕으로 현재까지의 대화 흐름, 손님의 특징, 중요한 내기 내용, 야엘의 감정 변화 등을 "
-        "한 문단으로 요약해줘. 중요한 정보는 절대 누락하지 마."
+        f"한 문단으로 요약해줘. 중요한 정보는 절대 누락하지 마. 단, 전체 길이는 {SUMMARY_MAX_TOKENS}토큰을 넘기지 마."
     )
 
     try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(summary_prompt)
-        return response.text.strip()
-    except:
-        return current_summary # 에러 시 기존 기억 유지
+        # model_name은 세션 초기화 블록 안에서만 정의되므로 여기서는 공통 상수를 사용
+        summary_config = {"max_output_tokens": SUMMARY_MAX_TOKENS}
+        if model_pool is None:
+            model = load_genai().GenerativeModel(MODEL_NAME, generation_config=summary_config)
+        else:
+            model = model_pool.get(generation_config=summary_config)
+        started = time.perf_counter()
+        if request_scheduler is None:
+            response = model.generate_content(summary_prompt)
+        else:
+            response = request_scheduler.submit(
+                session_id,
+                lambda: model.generate_content(summary_prompt),
+                tokens=int(token_budget.estimate_raw_tokens(summary_prompt)) + SUMMARY_MAX_TOKENS,
+                priority=scheduler.PRIORITY_SUMMARY,
+            )
 
-# --- 슬라이딩 윈도우 적용 함수 ---
-def apply_sliding_window(session_messages, window_size=20):
-    recent_msgs = session_messages[-window_size:]
-    formatted_history = []
-    for msg in recent_msgs:
-        role = "model" if msg["role"] == "assistant" else "user"
-        formatted_history.append({"role": role, "parts": [msg["content"]]})
-    return formatted_history
+        elapsed = time.perf_counter() - started
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = usage.prompt_token_count if usage else 0
+        output_tokens = usage.candidates_token_count if usage else 0
+        if call_stats is not None:
+            call_stats.update(seconds=elapsed, input_tokens=input_tokens, output_tokens=output_tokens)
+        if metrics_registry is not None:
+            metrics_registry.inc("summary_calls_total")
+            metrics_registry.observe("summary_seconds", elapsed)
+            if usage:
+                metrics_registry.inc("summary_input_tokens_total", input_tokens)
+                metrics_registry.inc("summary_output_tokens_total", output_tokens)
+                metrics_registry.inc("cost_usd_total", estimate_cost(input_tokens, output_tokens))
+        return response.text.strip(), evicted_end
+    except Exception as e:
+        print(f"대화 요약 실패: {e}")
+        return current_summary, watermark # 에러 시 기존 기억 유지
 
+# --- 백그라운드 요약 작업 ---
+# 요약은 모델을 한 번 더 호출해야 해서 느립니다. 답변을 기다리게 하지 않도록
+# 대화(sid)마다 최대 1개의 요약 작업을 전용 스레드 풀에서 돌리고, 끝나면 다음 턴에 반영합니다.
+# 작업은 Conversation에 달아 두므로, 같은 대화를 연 세션이 여러 개여도 요약은 한 번만 하고 결과를 함께 씁니다.
+# 스케줄러에 여유가 있을 때만 예약하므로, 요약 스레드가 스케줄러 줄에서 오래 기다리지 않습니다.
+def run_summary_job(store, session_id, current_summary, watermark, evicted_end, request_scheduler, model_pool, metrics_registry):
+    """
+    (백그라운드 스레드) 요약을 갱신하고, 새 요약이 들어간 모델까지 미리 만들어 둡니다.
+    반환값의 "stats"는 요약 호출의 시간/토큰 수 (호출하지 않았으면 빈 dict)이고,
+    요약할 게 없었거나 실패했으면 "summary"가 None입니다. (기존 기억 유지)
+    """
+    # 요약할 구간은 메모리(hot tail)가 아니라 저장소에서 읽음 (오래된 대화는 메모리에 없을 수 있음)
+    # 한 번에 요약하는 양에 상한이 있으므로 그 이상은 읽지 않음
+    new_messages = store.load(session_id, watermark, min(evicted_end, watermark + SUMMARY_MAX_INPUT_MESSAGES))
+    call_stats = {}
+    new_summary, new_watermark = summarize_old_conversations(
+        new_messages, current_summary, watermark, evicted_end,
+        request_scheduler=request_scheduler, session_id=session_id, model_pool=model_pool,
+        metrics_registry=metrics_registry, call_stats=call_stats
+    )
+    if new_watermark == watermark:
+        return {"summary": None, "stats": call_stats}
 
-# --- 모델 및 세션 설정 (동적 시스템 프롬프트 적용) ---
-# 요약 내용이 바뀔 때마다 시스템 프롬프트에 주입하기 위해 매번 설정을 확인합니다.
+    # 서버가 재시작되어도 이어갈 수 있도록 요약본과 watermark를 저장
+    store.save_memory(session_id, new_summary, new_watermark)
 
-base_instruction = (
-    "너의 이름은 '야엘 슈브'야. 직업은 메이드장이면서 카페의 지배인이야. "
-    "사용자를 지칭할때는 손님이라고 불러줘. 사용자에게 도움을 주긴 하지만, "
-    "말투는 기본적으로 '~해요', '~군요', '~인가요?' 식의 나긋나긋하고 격식 있는 존댓말로 해줘. "
-    "하지만 사용자의 약점이나 욕심을 발견하면 말줄임표(...)와 감탄사(하아, 으윽, 멋져요..!)를 섞어 흥분 상태를 표현해주고 "
-    "논리보다는 감정과 쾌락을 우선시하는 단어를 선택해줘. "
-    "예를 들면 '운, 리스크, 파멸, 쾌락, 내기, 전부, 미쳐버릴 것 같은' 같은 말을 자주 섞어서 사용해줘."
-    "이 카페의 이름은 '우이메카 카페'야."
-    "메뉴판의 내용은 에스프레소(2000원), 아메리카노(3000원), 카페라떼(4000원), 카푸치노(5000원)야."
-    "[중요: 이미지 출력 규칙]"
-    "대화 도중 손님이 '메뉴판', '가격표', '차림표' 등을 직접적으로 보여달라고 요청할 때만, 답변의 맨 마지막에 반드시 `{{SHOW_MENU}}` 라는 태그를 붙여줘."
-    "그 외의 상황(메뉴 추천 요청 등)에서는 붙이지 마."
-    "메뉴를 주문하면 사은품으로 야엘의 그림을 한개 선물해 주는 이벤트 중이야. 이 때에는 답변의 맨 마지막에 반드시 `{{YAEL2}}` 라는 태그를 붙여줘."
-)
+    new_model = model_pool.get(build_instruction(new_summary))
+    return {"summary": new_summary, "watermark": new_watermark, "model": new_model, "stats": call_stats}
 
-# [핵심] 현재 요약된 기억을 시스템 프롬프트에 추가
-current_instruction = base_instruction
-if st.session_state.long_term_memory:
-    current_instruction += f"\n\n[기억된 과거 대화 요약]: {st.session_state.long_term_memory}\n이 기억을 바탕으로 대화를 이어가."
+def collect_summary_job(conversation):
+    """
+    이 대화의 요약 작업이 끝났고 이 세션이 아직 반영하지 않았으면 요약본/watermark/모델/채팅 세션을 한 번에 교체합니다.
+    끝난 작업은 다음 작업이 시작될 때까지 Conversation에 남아 있으므로, 같은 대화의 다른 세션도 각자 반영합니다.
+    """
+    job = conversation.summary_job
+    if job is None or not job.done():
+        return
 
-# 모델 초기화 (instruction이 바뀔 수 있으므로 재설정 로직 필요할 수 있음)
-# Streamlit 특성상 매 실행마다 이 부분이 돌기 때문에, chat_session을 유지하되 
-# history만 갈아끼우는 방식이 효율적입니다. 
-# 하지만 System Instruction은 세션 시작 시 고정되므로, 
-# 요약이 갱신되면 새로운 chat_session을 만들어야 반영됩니다.
+    try:
+        result = job.result()
+    except Exception as e:
+        if st.session_state.get("failed_summary_job") is not job: # 같은 실패를 매 rerun마다 출력하지 않도록
+            st.session_state.failed_summary_job = job
+            print(f"백그라운드 요약 실패: {e}")
+        return
 
-if "chat_session" not in st.session_state or st.session_state.get("need_restart", False):
-    # 1. 모델 자동 선택 (사용자 환경에 맞춰 최신 모델 찾기)
-    model_name = "models/gemini-flash-lite-latest" # 기본값
-#    try:
-#        available_models = [m.name for m in genai.list_models()]
-        # 우선순위: 2.5 > 2.0 > 1.5
-#        if 'models/gemini-2.5-flash' in available_models:
-            #model_name = 'models/gemini-2.5-flash'
-#        elif 'models/gemini-2.0-flash-exp' in available_models:
-#        model_name = 'models/gemini-2.0-flash-001'
-#    except:
-#        pass # 리스트 확인 실패 시 기본값 사용
+    # 요약 호출의 시간/토큰은 다음 턴 기록에 넣기 위해 모아 둠 (비용이 두 번 잡히지 않도록 먼저 가져간 세션에만)
+    stats = result.pop("stats", None)
+    if stats:
+        st.session_state.setdefault("pending_summary_stats", []).append(stats)
 
-    # 안전 설정: 모든 필터를 "BLOCK_NONE" (차단 안 함)으로 설정
-    safety_settings = {
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    }
+    if result["summary"] is not None and result["watermark"] > st.session_state.summary_watermark:
+        st.session_state.long_term_memory = result["summary"]
+        st.session_state.summary_watermark = result["watermark"]
+        st.session_state.model = result["model"]
+        st.session_state.chat_session = result["model"].start_chat(history=[])
 
-    st.session_state.model = genai.GenerativeModel(
-        model_name=model_name,
-        system_instruction=current_instruction, # 요약이 포함된 프롬프트
-        safety_settings=safety_settings
-    )
-    st.session_state.chat_session = st.session_state.model.start_chat(history=[])
-    st.session_state.need_restart = False # 재시작 플래그 해제
+def schedule_summary_job(conversation, evicted_end):
+    """토큰 예산 밖으로 새로 밀려난 대화가 충분히 쌓였고 이 대화에 실행 중인 작업이 없으면 요약 작업을 예약합니다."""
+    job = conversation.summary_job
+    if job is not None and not job.done():
+        return
 
+    newly_evicted = evicted_end - st.session_state.summary_watermark
+    if newly_evicted < SUMMARY_BATCH_SIZE:
+        return
 
-# --- UI 구현 ---
-GAME_HEIGHT = 700
+    # 채팅 요청이 줄 서 있거나 한도가 빠듯하면 이번에는 건너뛰고 다음 턴에 다시 확인
+    # (밀린 대화는 watermark 이후 구간이므로 다음 요약부터 상한만큼씩 나눠서 들어갑니다)
+    if not get_request_scheduler().has_spare_budget(tokens=SUMMARY_MAX_TOKENS):
+        return
 
-st.set_page_config(layout="wide", page_title="우이메카 챗봇")
+    conversation.start_summary_job(lambda: get_summary_executor().submit(
+        run_summary_job,
+        get_conversation_store(),
+        st.session_state.session_id,
+        st.session_state.long_term_memory,
+        st.session_state.summary_watermark,
+        evicted_end,
+        get_request_scheduler(),
+        get_model_pool(),
+        get_metrics(),
+    ))
 
-col1, col2 = st.columns([1, 9])
-with col1:
-    try:
-        st.image("img/Yael.png", width=80)
-    except:
-        st.write("☕")
+# --- 토큰 추정 (로컬, 빠름) ---
+# 매 턴 count_tokens API를 부르면 느리므로 글자 수로 대충 추정하고,
+# 실제 응답의 usage_metadata.prompt_token_count로 보정 계수를 계속 맞춰갑니다. (token_budget.py)
 
-with col2:
-    st.subheader("야엘 슈브의 카페")
+@st.cache_resource
+def get_token_estimator():
+    # 프로세스 전체에서 공유하는 추정기 (보정 계수 = 실제 토큰 수 / 추정 토큰 수)
+    return token_budget.TokenEstimator()
 
-    # [디버깅용] 현재 기억하고 있는 내용 표시 (실제 서비스엔 숨겨도 됨)
-    if st.session_state.long_term_memory:
-        with st.expander("야엘의 기억 (요약본)"):
-            st.write(st.session_state.long_term_memory)
+def estimate_tokens(text):
+    return get_token_estimator().estimate(text)
 
-st.divider()
 
-col_img, col_chat = st.columns([1, 1])
+# --- 모델 및 세션 설정 (동적 시스템 프롬프트 적용) ---
+# 요약 내용이 바뀔 때마다 시스템 프롬프트에 주입하기 위해 매번 설정을 확인합니다.
+# [핵심] 현재 요약된 기억을 시스템 프롬프트에 추가
+current_instruction = build_instruction(st.session_state.long_term_memory)
 
-with col_img:
-    character_path = "img/Yael_1.png"
-    bg_path = "img/cafe_bg.jpg"    # 배경 (카페 이미지)
+# 모델 초기화 (instruction이 바뀔 수 있으므로 재설정 로직 필요할 수 있음)
+# Streamlit 특성상 매 실행마다 이 부분이 돌기 때문에, chat_session을 유지하되 
+# history만 갈아끼우는 방식이 효율적입니다. 
+# 하지만 System Instruction은 세션 시작 시 고정되므로, 
+# 요약이 갱신되면 새로운 chat_session을 만들어야 반영됩니다.
+# (요약 갱신 시의 교체는 collect_summary_job()이 모델과 세션을 한 번에 바꿔 끼웁니다.)
 
-    character_base64 = get_img_as_base64(character_path)
-    bg_base64 = get_img_as_base64(bg_path)
+if "chat_session" not in st.session_state:
+    # 인트로 동안 미리 준비해 둔 모델이 있으면 그대로 사용 (요약이 없는 첫 세션일 때만 해당)
+    warmup = st.session_state.pop("warmup", None)
+    warmed = None
+    if warmup is not None and not st.session_state.long_term_memory:
+        try:
+            warmed = warmup.result(timeout=WARMUP_TIMEOUT)
+        except Exception:
+            warmed = None # 준비 실패 또는 시간 초과 시 아래에서 풀의 모델로 바로 생성
 
-    character_src = f"data:image/png;base64,{character_base64}"
-    bg_css = f"url('data:image/png;base64,{bg_base64}')"
+    if warmed:
+        st.session_state.model, st.session_state.chat_session = warmed
+    else:
+        # 요약이 포함된 프롬프트로 풀에서 모델을 받아옴 (같은 설정이면 다른 세션과 공유)
+        st.session_state.model = get_model_pool().get(current_instruction)
+        st.session_state.chat_session = st.session_state.model.start_chat(history=[])
 
-    st.markdown(
+# 백그라운드 요약이 끝났으면 지금 반영
+# (채팅은 chat_area fragment만 다시 실행되므로, 위쪽 헤더의 '야엘의 기억'은 다음 전체 rerun 때 갱신됩니다)
+collect_summary_job(get_conversation_cache().get(st.session_state.session_id))
+
+
+@st.cache_data(max_entries=8)
+def build_scene_html(character_path, bg_path, game_height, asset_version):
+    """
+    배경 + 캐릭터 장면의 CSS/HTML을 만듭니다.
+    이미지 경로와 파일 수정 시각(asset_version)이 같으면 캐시된 문자열을 그대로 재사용합니다.
+    """
+    character_src = asset_src(character_path)
+    bg_css = f"url('{asset_src(bg_path)}')"
+
+    return (
         f"""
         <style>
             /* 1. 배경이 되는 컨테이너 (액자) */
             .scene-container {{
                 width: 100%;
-                height: {GAME_HEIGHT}px; /* 게임 높이와 동일하게 */
-                
+                height: {game_height}px; /* 게임 높이와 동일하게 */
+            
                 /* 배경 이미지 설정 */
                 background-image: {bg_css};
                 background-size: cover; /* 이미지가 찌그러지지 않고 꽉 참 */
                 background-position: center; /* 이미지 중앙 정렬 */
-                
+            
                 border-radius: 15px; /* 모서리 둥글게 */
                 border: 1px solid #31333f33; /* 액자 테두리 */
                 position: relative; /* 내부 캐릭터 배치의 기준점 */
@@ -256,18 +674,18 @@ with col_img:
                 /* 캐릭터 크기 조절 (상황에 따라 조절하세요) */
                 height: 90%;  /* 화면 높이의 90% 크기 */
                 width: auto;
-                
+            
                 /* 위치 잡기 (가운데 정렬) */
                 position: absolute; 
                 bottom: 0; /* 바닥에 딱 붙임 */
                 left: 50%; /* 가로 50% 지점 */
                 transform: translateX(-50%); /* 정확한 중앙 정렬 보정 */
-                
+            
                 /* 애니메이션 효과 (선택사항: 부드럽게 등장) */
                 transition: all 0.3s ease;
                 filter: drop-shadow(0 0 10px rgba(0,0,0,0.3)); /* 캐릭터 뒤 그림자 */
             }}
-            
+        
             /* (선택) 마우스 올리면 살짝 확대되는 효과 */
             .character-overlay:hover {{
                 transform: translateX(-50%) scale(1.02);
@@ -278,119 +696,364 @@ with col_img:
             <img src="{character_src}" class="character-overlay">
         </div>
         <p style="text-align: center; font-size: 14px; color: gray;">야엘 슈브</p>
-        """,
-        unsafe_allow_html=True
+        """
     )
 
+
+# --- 스트리밍 출력 (청크를 모았다가 일정 간격으로만 화면 갱신) ---
+# 청크마다 전체 답변을 다시 markdown으로 보내면 답변 길이의 제곱에 비례해 전송량이 늘어납니다.
+STREAM_FRAME_INTERVAL = 0.1 # 초: 화면을 다시 그리는 최소 간격 (약 10fps)
+STREAM_FLUSH_BYTES = 1024   # 이만큼 새 글자가 쌓이면 간격과 상관없이 바로 갱신
+
+class StreamRenderer:
+    """
+    스트리밍 청크를 리스트에 모아 두었다가 STREAM_FRAME_INTERVAL / STREAM_FLUSH_BYTES마다 한 번씩만
+    placeholder를 갱신합니다. 첫 청크까지 걸린 시간(TTFT)과 초당 출력 토큰 수도 함께 기록합니다.
+    """
+
+    def __init__(self, placeholder, frame_interval=STREAM_FRAME_INTERVAL, flush_bytes=STREAM_FLUSH_BYTES):
+        self.placeholder = placeholder
+        self.frame_interval = frame_interval
+        self.flush_bytes = flush_bytes
+
+        self.text = ""          # 지금까지 화면에 반영된 답변
+        self.pending = []       # 아직 화면에 반영되지 않은 청크들
+        self.pending_bytes = 0
+        self.flush_count = 0
+        self.bytes_pushed = 0   # 클라이언트로 보낸 markdown 총량 (바이트)
+
+        self.started_at = time.perf_counter() # 요청 시작 시각
+        self.first_chunk_at = None
+        self.finished_at = None
+        self.last_flush_at = self.started_at
+
+    def write(self, text):
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+
+        self.pending.append(text)
+        self.pending_bytes += len(text.encode("utf-8"))
+
+        # 첫 청크는 바로 보여주고, 이후에는 시간/분량 기준으로 묶어서 갱신
+        if self.flush_count == 0 or self.pending_bytes >= self.flush_bytes or now - self.last_flush_at >= self.frame_interval:
+            self.flush(cursor=True)
+
+    def flush(self, cursor=True):
+        if self.pending:
+            self.text += "".join(self.pending)
+            self.pending = []
+            self.pending_bytes = 0
+
+        shown = self.text + "▌" if cursor else self.text
+        self.placeholder.markdown(shown)
+        self.bytes_pushed += len(shown.encode("utf-8"))
+        self.flush_count += 1
+        self.last_flush_at = time.perf_counter()
+
+    def finish(self):
+        """남은 청크를 한 번에 합쳐서 커서 없이 최종 답변을 그리고, 전체 답변을 돌려줍니다."""
+        self.finished_at = time.perf_counter()
+        self.flush(cursor=False)
+        return self.text
+
+    @property
+    def time_to_first_token(self):
+        if self.first_chunk_at is None:
+            return None
+        return self.first_chunk_at - self.started_at
+
+    def tokens_per_second(self, output_tokens=None):
+        """첫 청크 이후 초당 출력 토큰 수 (output_tokens가 없으면 로컬 추정치 사용)"""
+        if self.first_chunk_at is None or self.finished_at is None:
+            return None
+        if output_tokens is None:
+            output_tokens = estimate_tokens(self.text)
+        elapsed = self.finished_at - self.first_chunk_at
+        return output_tokens / elapsed if elapsed > 0 else None
+
+
+# --- 제어 태그 (답변 속 {{...}} 태그 -> 이미지 출력) ---
+# 새 태그를 추가하려면 이 표에 한 줄만 추가하면 됩니다. (시스템 프롬프트에 태그 사용 규칙도 함께 추가)
+CONTROL_TAGS = {
+    "{{SHOW_MENU}}": {"image": "img/cafe_menu.jpg", "caption": "여기 메뉴판입니다."},
+    "{{YAEL2}}": {"image": "img/Yael_2.png", "caption": None},
+}
+
+class ControlTagScanner:
+    """
+    스트리밍 청크에서 제어 태그를 찾아 화면에 보일 글자와 발견된 태그를 분리합니다.
+    태그가 여러 청크에 걸쳐 잘려 들어와도(예: "{{SHOW_" + "MENU}}") 태그가 될 수 있는 부분은
+    다음 청크가 올 때까지 보류하므로, 화면에 태그 문자열이 잠깐이라도 노출되지 않습니다.
+    """
+
+    def __init__(self, tags=CONTROL_TAGS):
+        self.tags = tags
+        self.buffer = "" # 태그의 앞부분일 수 있어서 아직 내보내지 않은 글자
+
+    def feed(self, text):
+        """청크를 넣으면 (화면에 보일 글자, 이번에 발견된 태그 목록)을 돌려줍니다."""
+        self.buffer += text
+        visible = []
+        fired = []
+
+        while self.buffer:
+            start = self.buffer.find("{{")
+            if start == -1:
+                # 마지막 글자가 '{'면 다음 청크에서 태그가 시작될 수 있으니 남겨둠
+                keep = 1 if self.buffer.endswith("{") else 0
+                visible.append(self.buffer[:len(self.buffer) - keep])
+                self.buffer = self.buffer[len(self.buffer) - keep:]
+                break
+
+            visible.append(self.buffer[:start])
+            self.buffer = self.buffer[start:]
+
+            matched = next((tag for tag in self.tags if self.buffer.startswith(tag)), None)
+            if matched:
+                fired.append(matched)
+                self.buffer = self.buffer[len(matched):]
+            elif any(tag.startswith(self.buffer) for tag in self.tags):
+                break # 태그가 잘려서 들어오는 중 -> 다음 청크를 기다림
+            else:
+                # 태그가 아닌 '{{' -> 한 글자 내보내고 계속 검사
+                visible.append(self.buffer[0])
+                self.buffer = self.buffer[1:]
+
+        return "".join(visible), fired
+
+    def flush(self):
+        """스트림이 끝났을 때 보류 중이던 글자(완성되지 않은 태그 조각)를 그대로 돌려줍니다."""
+        rest = self.buffer
+        self.buffer = ""
+        return rest
+
+def stream_reply(text_chunks, renderer, image_area):
+    """
+    텍스트 청크를 태그 스캐너 -> 스트리밍 렌더러 순서로 흘려보냅니다.
+    태그가 발견되는 즉시 image_area에 이미지를 띄우므로, 나머지 답변과 이미지가 동시에 로드됩니다.
+    반환값: (출력한 이미지 경로 목록, 태그가 포함된 답변 원문)
+    """
+    scanner = ControlTagScanner()
+    images = []
+    raw_parts = []
+
+    for text in text_chunks:
+        raw_parts.append(text)
+        visible, fired = scanner.feed(text)
+        for tag in fired:
+            action = CONTROL_TAGS[tag]
+            if not os.path.exists(action["image"]):
+                continue # 이미지 파일이 없으면 태그만 지우고 답변은 계속
+            image_area.image(sized_image(action["image"], assets.CONTENT_WIDTH), caption=action["caption"], use_container_width=True)
+            images.append(action["image"])
+        renderer.write(visible)
+
+    renderer.write(scanner.flush())
+    return images, "".join(raw_parts)
+
+def replay_chunks(text, chunk_size=40):
+    """캐시된 답변을 일반 스트리밍과 같은 경로로 흘려보내기 위해 청크로 나눕니다."""
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+# --- UI 구현 ---
+GAME_HEIGHT = 700
+
+st.set_page_config(layout="wide", page_title="우이메카 챗봇")
+
+col1, col2 = st.columns([1, 9])
+with col1:
+    try:
+        st.image(sized_image("img/Yael.png", assets.HEADER_WIDTH), width=80)
+    except:
+        st.write("☕")
+
+with col2:
+    st.subheader("야엘 슈브의 카페")
+
+    # [디버깅용] 현재 기억하고 있는 내용 표시 (실제 서비스엔 숨겨도 됨)
+    if st.session_state.long_term_memory:
+        with st.expander("야엘의 기억 (요약본)"):
+            st.write(st.session_state.long_term_memory)
+
+st.divider()
+
+col_img, col_chat = st.columns([1, 1])
+
+with col_img:
+    character_path = "img/Yael_1.png"
+    bg_path = "img/cafe_bg.jpg"    # 배경 (카페 이미지)
+
+    # 장면 이미지가 없어도 채팅은 할 수 있도록, 빠진 파일만 알려주고 장면은 건너뜀
+    missing_scene_files = [path for path in (character_path, bg_path) if not os.path.exists(path)]
+    if missing_scene_files:
+        st.warning(f"장면 이미지를 찾을 수 없습니다: {', '.join(missing_scene_files)}")
+    else:
+        scene_version = (os.path.getmtime(character_path), os.path.getmtime(bg_path))
+        st.markdown(
+            build_scene_html(character_path, bg_path, GAME_HEIGHT, scene_version),
+            unsafe_allow_html=True
+        )
+
 # --- 오른쪽: 채팅 영역 ---
-with col_chat:
+# 대화가 길어지면 전체 기록을 매번 다시 그리는 비용이 커지므로 최근 HISTORY_PAGE_SIZE개씩만 보여주고,
+# 더 오래된 대화는 '이전 대화 더 보기' 버튼으로 한 페이지씩 불러옵니다.
+HISTORY_PAGE_SIZE = 30
+
+if "history_pages" not in st.session_state:
+    st.session_state.history_pages = 1 # 현재 화면에 펼쳐진 페이지 수
+
+def show_older_messages():
+    st.session_state.history_pages += 1
+
+# 채팅 영역은 fragment로 분리: 메시지를 보내도 이 함수만 다시 실행되고,
+# 헤더/장면(배경+캐릭터) 컬럼은 다시 그리지 않습니다.
+@st.fragment
+def chat_area():
+    # 채팅 턴은 이 fragment만 다시 실행되므로 턴별 시간은 여기서 잽니다.
+    # 이 스레드에서 기록되는 값(에셋 인코딩 시간, 429 횟수 등)도 이번 실행분만 따로 합산
+    fragment_started = time.perf_counter()
+    registry = get_metrics()
+    registry.start_scope()
+
+    # fragment만 다시 실행될 때도 이 세션의 '최근 활동 시각'이 갱신되도록 캐시에서 다시 가져옴
+    conversation = get_conversation_cache().get(st.session_state.session_id)
     chat_container = st.container(height=GAME_HEIGHT, border=True)
 
-    # 대화 내용 출력
+    # 대화 내용 출력 (그리는 데 걸린 시간도 측정)
+    history_render_started = time.perf_counter()
     with chat_container:
-        AVATARS = {"user": "img/User.png", "assistant": "img/Yael.png"}
+        AVATARS = {
+            "user": sized_image("img/User.png", assets.AVATAR_WIDTH),
+            "assistant": sized_image("img/Yael.png", assets.AVATAR_WIDTH),
+        }
 
-        for message in st.session_state.messages:
+        # 최근 N페이지 분량만 그리기
+        visible_count = st.session_state.history_pages * HISTORY_PAGE_SIZE
+        hidden_count = max(conversation.total - visible_count, 0)
+        if hidden_count:
+            st.button(f"이전 대화 더 보기 ({hidden_count}개)", on_click=show_older_messages, use_container_width=True)
+
+        # 메모리에 없는 오래된 페이지는 이때만 저장소에서 읽어옴
+        for message in conversation.load(hidden_count, conversation.total):
             avatar_img = AVATARS.get(message["role"])
             # 이미지 로드 실패 방지
             try:
                 with st.chat_message(message["role"], avatar=avatar_img):
                     st.markdown(message["content"])
 
-                    if "image" in message:
-                        st.image(message["image"], use_container_width=True)
+                    # 답변과 함께 출력된 이미지들 (예전 기록은 "image" 키 하나로 저장되어 있음)
+                    for image_path in message.get("images", [message["image"]] if "image" in message else []):
+                        st.image(sized_image(image_path, assets.CONTENT_WIDTH), use_container_width=True)
 
             except:
                 with st.chat_message(message["role"]):
                     st.markdown(message["content"])
 
+    history_render_seconds = time.perf_counter() - history_render_started
+    registry.observe("history_render_seconds", history_render_seconds)
+
     # --- 채팅 입력 및 처리 ---
     if prompt := st.chat_input("메시지를 입력하세요"):
         
         # 1. 사용자 메시지 화면 표시
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        conversation.append({"role": "user", "content": prompt})
 
         with chat_container:
             try:
-                with st.chat_message("user", avatar="img/User.png"):
+                with st.chat_message("user", avatar=AVATARS["user"]):
                     st.markdown(prompt)
             except:
                 with st.chat_message("user"):
                     st.markdown(prompt)
 
             full_response = ""
-            response_image = None  # 이미지가 없을 때는 None
+            response_images = []  # 답변 중 태그로 출력된 이미지들
             usage_metadata = None
 
-            chat_context = st.chat_message("assistant", avatar="img/Yael.png")
+            chat_context = st.chat_message("assistant", avatar=AVATARS["assistant"])
 
             with chat_context:
                 response_placeholder = st.empty()
+                image_area = st.container() # 태그가 나오면 답변 아래에 이미지를 바로 출력
                 
-                # [단계 1] 오래된 대화가 있으면 요약 업데이트 (5턴마다 한번씩 실행하도록 최적화 가능)
-                # 여기서는 대화가 길어지면 매번 체크 (윈도우 20개 넘으면)
-                if len(st.session_state.messages) > 20:
-                    # 윈도우 밖 대화들을 요약해서 메모리에 저장
-                    new_summary = summarize_old_conversations(
-                        st.session_state.messages[:-1], # 현재 프롬프트 제외
-                        st.session_state.long_term_memory,
-                        window_size=20
-                    )
-                    
-                    # 요약 내용이 바뀌었다면 다음 턴에 반영하기 위해 플래그 설정
-                    if new_summary != st.session_state.long_term_memory:
-                        st.session_state.long_term_memory = new_summary
-                        st.session_state.need_restart = True # System Instruction 갱신 필요
-
-                # [단계 2] 슬라이딩 윈도우로 최근 대화만 API에 전달
-                previous_messages = st.session_state.messages[:-1]
-                recent_history = apply_sliding_window(previous_messages, window_size=20)
-                
-                # 만약 요약이 방금 갱신되어 재시작이 필요하면 세션 재생성 (현재 턴은 기존 세션으로 처리하거나, 여기서 재생성)
-                if st.session_state.get("need_restart"):
-                    # Instruction 갱신하여 모델 재로드
-                    current_instruction = base_instruction + f"\n\n[기억된 과거 대화 요약]: {st.session_state.long_term_memory}"
-                    st.session_state.model = genai.GenerativeModel(
-                        model_name=model_name,
-                        system_instruction=current_instruction
-                    )
-                    st.session_state.chat_session = st.session_state.model.start_chat(history=recent_history)
-                    st.session_state.need_restart = False
-                else:
-                    st.session_state.chat_session.history = recent_history
+                # [단계 1] 토큰 예산 안에 들어가는 최근 대화만 API에 전달
+                # 시스템 프롬프트 + 장기 기억 + 이번 메시지도 같은 예산에서 차감합니다.
+                collect_summary_job(conversation)
+                previous_messages = conversation.messages[:-1] # 현재 프롬프트 제외 (최근 대화만)
+                active_instruction = build_instruction(st.session_state.long_term_memory)
+                reserved_tokens = estimate_tokens(active_instruction) + estimate_tokens(prompt) + token_budget.MESSAGE_TOKEN_OVERHEAD
+                recent_history, window_start = token_budget.build_context(
+                    previous_messages, CONTEXT_TOKEN_BUDGET, reserved_tokens, get_token_estimator()
+                )
+                st.session_state.chat_session.history = recent_history
+
+                # 보정용: 이번 요청 전체의 (보정 전) 추정 토큰 수
+                raw_prompt_estimate = sum(
+                    token_budget.estimate_raw_tokens(text)
+                    for text in [active_instruction, prompt] + [msg["content"] for msg in previous_messages[window_start:]]
+                )
+
+                # [단계 2] 예산 밖으로 밀려난 대화 요약은 백그라운드로 보내고, 답변은 지금의 기억으로 바로 시작합니다.
+                # 새로 밀려난 대화가 SUMMARY_BATCH_SIZE개 쌓일 때만 요약 작업을 예약하고,
+                # 작업이 끝나면 이후 턴에서 collect_summary_job()이 새 요약과 모델을 한 번에 교체합니다.
+                # (window_start는 hot tail 기준이므로 전체 기준 번호로 바꿔서 전달)
+                schedule_summary_job(conversation, conversation.offset + window_start)
+
+                # 스트리밍 요청 (청크는 모아서 일정 간격으로만 화면 갱신)
+                # 제어 태그({{SHOW_MENU}} 등)는 스트리밍 도중 바로 처리되고 화면에는 보이지 않습니다.
+                renderer = StreamRenderer(response_placeholder)
+                cached_reply = None
+                input_tokens = None
+                output_tokens = None
+                turn_error = None # 실패한 턴도 기록에 남기기 위한 에러 종류
 
                 try:
-                    # 스트리밍 요청
-                    response = st.session_state.chat_session.send_message(prompt, stream=True)
-                    for chunk in response:
-                        full_response += chunk.text
-                        response_placeholder.markdown(full_response + "▌")
-
-                    if "{{SHOW_MENU}}" in full_response:
-                        # 태그 제거
-                        full_response = full_response.replace("{{SHOW_MENU}}", "")
-                        
-                        # 깔끔해진 텍스트로 화면 업데이트
-                        response_placeholder.markdown(full_response)
-                        
-                        # ★ 핵심 수정: image_url 대신 response_image 변수에 값 할당
-                        response_image = "img/cafe_menu.jpg" 
-                        
-                        # 화면에 즉시 출력
-                        st.image(response_image, caption="여기 메뉴판입니다.", use_container_width=True)
+                    # 응답 캐시 확인 (대화 초반의 반복 질문만 해당)
+                    # 토큰 예산으로 잘린 history가 아니라 실제 대화 길이로 판단합니다.
+                    # (긴 메시지 하나 때문에 history가 비어도 앞선 대화가 있으면 캐시하지 않음)
+                    cache_key = None
+                    if RESPONSE_CACHE_ENABLED and conversation.total - 1 <= RESPONSE_CACHE_MAX_HISTORY:
+                        cache_key = response_cache.make_key(prompt, active_instruction, MODEL_NAME, previous_messages)
+                        cached_reply = get_response_cache().get(cache_key)
 
-                    if "{{YAEL2}}" in full_response:
-                        # 태그 제거
-                        full_response = full_response.replace("{{YAEL2}}", "")
-                        
-                        # 깔끔해진 텍스트로 화면 업데이트
-                        response_placeholder.markdown(full_response)
-                        
-                        # ★ 핵심 수정: image_url 대신 response_image 변수에 값 할당
-                        response_image = "img/Yael_2.png" 
-                        
-                        # 화면에 즉시 출력
-                        st.image(response_image, use_container_width=True)
+                    if cached_reply is not None:
+                        # 캐시된 답변도 같은 스트리밍/태그 처리 경로로 재생 (메뉴판 이미지 등이 그대로 나옴)
+                        response = None
+                        response_images, _ = stream_reply(replay_chunks(cached_reply), renderer, image_area)
+                    else:
+                        chat_session = st.session_state.chat_session
+
+                        def open_reply_stream():
+                            # 재시도할 때마다 history를 다시 넣어서 실패한 요청의 흔적을 지웁니다.
+                            chat_session.history = recent_history
+                            stream = chat_session.send_message(prompt, stream=True)
+                            chunks = iter(stream)
+                            first_chunk = next(chunks, None) # 429 에러는 첫 청크를 받기 전에 발생
+                            return stream, first_chunk, chunks
+
+                        def show_queue_position(position, eta):
+                            response_placeholder.markdown(f"☕ 손님이 많아서 잠시 줄을 서는 중이에요... (대기 {position}번째, 약 {eta:.0f}초)")
+
+                        # 요청 스케줄러를 거쳐서 전송 (분당 한도 대기 + 429 자동 재시도)
+                        response, first_chunk, rest_chunks = get_request_scheduler().submit(
+                            st.session_state.session_id,
+                            open_reply_stream,
+                            tokens=int(raw_prompt_estimate * get_token_estimator().scale),
+                            priority=scheduler.PRIORITY_CHAT,
+                            on_wait=show_queue_position,
+                            on_rate_limited=lambda attempt: registry.inc("chat_rate_limited_total"),
+                        )
+                        chunks = itertools.chain([first_chunk] if first_chunk is not None else [], rest_chunks)
+                        response_images, raw_response = stream_reply((chunk.text for chunk in chunks), renderer, image_area)
+
+                        # 캐시 대상 턴이면 태그가 포함된 원문 그대로 저장
+                        if cache_key is not None:
+                            get_response_cache().put(cache_key, raw_response)
+
+                    full_response = renderer.finish()
 
                     # 토큰 정보 가져오기 (API 호출했을 때만 존재)
                     if hasattr(response, 'usage_metadata'):
@@ -399,10 +1062,10 @@ with col_chat:
                     message_data = {"role": "assistant", "content": full_response}
                     
                     # 이미지가 있는 경우에만 키 추가
-                    if response_image:
-                        message_data["image"] = response_image
+                    if response_images:
+                        message_data["images"] = response_images
                     
-                    st.session_state.messages.append(message_data)
+                    conversation.append(message_data)
 
                     # 토큰 사용량 표시 (LLM을 썼을 때만)
                     if usage_metadata:
@@ -411,6 +1074,20 @@ with col_chat:
                         total_tokens = usage_metadata.total_token_count
                         st.caption(f"💰 토큰 사용량: {total_tokens} (In: {input_tokens} / Out: {output_tokens})")
 
+                        # 실제 입력 토큰 수로 로컬 추정기 보정
+                        get_token_estimator().calibrate(raw_prompt_estimate, input_tokens)
+
+                    # 캐시에서 재생한 답변이면 표시 (적중/미적중 횟수 포함)
+                    if cached_reply is not None:
+                        cache_stats = get_response_cache().stats()
+                        st.caption(f"💾 저장된 답변 재사용 (적중 {cache_stats['hits']} / 미적중 {cache_stats['misses']})")
+
+                    # 첫 토큰까지 걸린 시간 (TTFT) / 초당 출력 토큰 표시 (기록은 아래 측정 로그에 남김)
+                    time_to_first_token = renderer.time_to_first_token
+                    if time_to_first_token is not None:
+                        tokens_per_second = renderer.tokens_per_second(output_tokens) or 0
+                        st.caption(f"⏱️ 첫 응답까지: {time_to_first_token:.2f}초 · 출력 {tokens_per_second:.1f} tok/s")
+
                     # # response 객체 안에 usage_metadata가 들어있습니다.
                     # if response.usage_metadata:
                     #     input_tokens = response.usage_metadata.prompt_token_count
@@ -429,19 +1106,87 @@ with col_chat:
                     
                     # raise ResourceExhausted # 429에러 예외처리 테스트
 
-                # 429 에러(ResourceExhausted) 전용 처리
-                except ResourceExhausted:
+                # 429 에러(ResourceExhausted) 전용 처리 (스케줄러가 여러 번 재시도해도 안 될 때)
+                except resource_exhausted_error():
                     error_msg = (
                         "하아... 너무 격렬해요... 우리 잠시만 쉬었다가 해요..."
                     )
                     response_placeholder.markdown(error_msg)
                     # 에러 메시지는 대화 기록(history)에 저장하지 않음 (선택 사항)
+                    turn_error = "rate_limited"
                 
                 # 그 외 일반적인 에러 처리
                 except Exception as e:
                     error_msg = f"어머, 예상치 못한 문제가 발생했군요. 카페 마스터에게 이 내용을 전달해 주시겠어요?({str(e)})"
                     response_placeholder.error(error_msg)
+                    turn_error = type(e).__name__
                     if st.button("대화 다시 시작하기"):
                         st.session_state.clear()
+                        st.query_params.clear() # 새 대화 id로 시작
                         st.rerun()
 
+                # 턴별 측정값 기록 (JSONL 로그 + Prometheus 히스토그램 + 세션별 비용)
+                # 429 재시도가 다 실패했거나 다른 에러가 난 턴도 error와 함께 기록합니다.
+                finally:
+                    time_to_first_token = renderer.time_to_first_token
+                    tokens_per_second = None
+                    stream_seconds = None
+                    if time_to_first_token is not None:
+                        tokens_per_second = renderer.tokens_per_second(output_tokens) or 0
+                        # 스트리밍 도중 실패했으면 finish()가 불리지 않았으므로 지금까지의 시간
+                        stream_seconds = (renderer.finished_at or time.perf_counter()) - renderer.first_chunk_at
+                    turn_cost = estimate_cost(input_tokens, output_tokens)
+                    registry.inc("turns_total")
+                    if turn_error is not None:
+                        registry.inc("failed_turns_total")
+                    if cached_reply is not None:
+                        registry.inc("cached_turns_total")
+                    if time_to_first_token is not None:
+                        registry.observe("ttft_seconds", time_to_first_token)
+                    if stream_seconds is not None:
+                        registry.observe("stream_seconds", stream_seconds)
+                        registry.observe("output_tokens_per_second", tokens_per_second, buckets=(5, 10, 25, 50, 100, 200, 400, 800))
+                    if usage_metadata:
+                        registry.inc("input_tokens_total", input_tokens)
+                        registry.inc("output_tokens_total", output_tokens)
+                        registry.inc("cost_usd_total", turn_cost)
+                    # 이번 턴에만 해당하는 값: fragment 실행 시간, 이 턴의 429 횟수/에셋 인코딩 시간,
+                    # 지난 턴 이후 끝난 이 세션의 요약 호출 (요약 비용은 cost_usd_total에는 요약할 때 이미 더했고,
+                    # 세션별 비용에는 여기서 이 턴의 cost에 합쳐서 반영)
+                    turn_scope = registry.scope_totals()
+                    summary_stats = st.session_state.pop("pending_summary_stats", [])
+                    summary_cost = sum(estimate_cost(stats["input_tokens"], stats["output_tokens"]) for stats in summary_stats)
+                    registry.record_turn({
+                        "session_id": st.session_state.session_id,
+                        "rerun_seconds": time.perf_counter() - fragment_started,
+                        "turn": (conversation.total + 1) // 2, # 실패한 턴은 답변이 저장되지 않음
+                        "error": turn_error,
+                        "cached": cached_reply is not None,
+                        "ttft": time_to_first_token,
+                        "stream_seconds": stream_seconds,
+                        "tokens_per_second": tokens_per_second,
+                        "input_tokens": input_tokens,
+                        "output_tokens": output_tokens,
+                        "cost": turn_cost + summary_cost,
+                        "history_render_seconds": history_render_seconds,
+                        "repaints": renderer.flush_count,
+                        "bytes_pushed": renderer.bytes_pushed,
+                        "rate_limited": turn_scope.get("chat_rate_limited_total", 0),
+                        "asset_encode_seconds": turn_scope.get("asset_encode_seconds", 0.0),
+                        "summary_calls": len(summary_stats),
+                        "summary_seconds": sum(stats["seconds"] for stats in summary_stats),
+                        "summary_input_tokens": sum(stats["input_tokens"] for stats in summary_stats),
+                        "summary_output_tokens": sum(stats["output_tokens"] for stats in summary_stats),
+                        "summary_cost": summary_cost,
+                    })
+
+    # 채팅 턴처럼 fragment만 다시 실행된 경우의 소요 시간도 rerun_seconds에 포함
+    # (전체 rerun이면 스크립트 끝에서 fragment를 포함한 전체 시간으로 한 번만 기록)
+    if get_script_run_ctx().fragment_ids_this_run:
+        registry.observe("rerun_seconds", time.perf_counter() - fragment_started)
+
+with col_chat:
+    chat_area()
+
+# 이번 rerun 전체에 걸린 시간 (인트로/관리자 화면처럼 중간에 st.stop()한 경우는 제외)
+get_metrics().observe("rerun_seconds", time.perf_counter() - rerun_started)
@@ -0,0 +1,178 @@
+"""
+턴별 지연 시간/비용 측정.
+
+- 카운터와 히스토그램을 프로세스 전체에서 모아서 Prometheus 텍스트 형식으로 내보냅니다.
+- 히스토그램은 Prometheus용 버킷 외에 최근 값들도 보관해서 관리자 화면에서 p50/p95/p99를 보여줍니다.
+- 턴마다 한 줄씩 JSONL 로그(크기 기준으로 자동 교체)에 기록합니다.
+- 세션별 토큰 사용량과 비용을 누적합니다.
+- start_scope()를 부른 스레드에서 기록한 값은 따로 합산해 두었다가 scope_totals()로 꺼낼 수 있습니다.
+  (턴 하나 동안 이 세션이 쓴 값만 턴 기록에 넣기 위해. 예: 에셋 인코딩 시간, 429 횟수)
+"""
+import bisect
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 초 단위 지연 시간용 기본 버킷
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RECENT_SAMPLES = 2000 # 백분위 계산에 쓰는 최근 값 개수 (히스토그램마다)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1) # 마지막 칸은 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class MetricsRegistry:
+    def __init__(self, log_path=None, max_log_bytes=10_000_000, log_backups=5):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.sessions = {} # 세션 id -> {"turns", "input_tokens", "output_tokens", "cost"}
+        self._collectors = []
+        self._local = threading.local() # 스레드별 scope 합계
+
+        self._logger = None
+        if log_path:
+            if os.path.dirname(log_path):
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=max_log_bytes, backupCount=log_backups, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger(f"yael.metrics.{id(self)}")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            self._logger.addHandler(handler)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._add_to_scope(name, value)
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(buckets)
+            self.histograms[name].observe(value)
+        self._add_to_scope(name, value)
+
+    def start_scope(self):
+        """이 스레드에서 지금부터 기록하는 값을 따로 합산하기 시작합니다. (이전 합계는 버림)"""
+        self._local.totals = {}
+
+    def scope_totals(self):
+        """start_scope() 이후 이 스레드에서 기록한 값의 합계 {이름: 합계}"""
+        return dict(getattr(self._local, "totals", None) or {})
+
+    def _add_to_scope(self, name, value):
+        totals = getattr(self._local, "totals", None)
+        if totals is not None:
+            totals[name] = totals.get(name, 0) + value
+
+    def add_collector(self, collect):
+        """collect()가 돌려주는 {이름: 값}을 내보낼 때마다 gauge로 함께 출력합니다. (예: 스케줄러 통계)"""
+        self._collectors.append(collect)
+
+    def record_turn(self, record):
+        """
+        턴 하나의 측정값을 기록합니다. record에 session_id, input_tokens, output_tokens, cost가 있으면
+        세션별 누적에도 더하고, JSONL 로그에 한 줄로 남깁니다.
+        """
+        record = dict(record, ts=time.time())
+        with self._lock:
+            session = self.sessions.setdefault(
+                record.get("session_id"), {"turns": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0}
+            )
+            session["turns"] += 1
+            session["input_tokens"] += record.get("input_tokens") or 0
+            session["output_tokens"] += record.get("output_tokens") or 0
+            session["cost"] += record.get("cost") or 0.0
+        if self._logger is not None:
+            self._logger.info(json.dumps(record, ensure_ascii=False))
+
+    def summary(self):
+        """관리자 화면용: 히스토그램별 개수/평균/p50/p95/p99"""
+        with self._lock:
+            rows = []
+            for name, histogram in sorted(self.histograms.items()):
+                rows.append({
+                    "metric": name,
+                    "count": histogram.count,
+                    "mean": histogram.sum / histogram.count if histogram.count else None,
+                    "p50": histogram.percentile(0.50),
+                    "p95": histogram.percentile(0.95),
+                    "p99": histogram.percentile(0.99),
+                })
+            return rows
+
+    def render_prometheus(self, prefix="yael_"):
+        """Prometheus 텍스트 형식 (counter / histogram / gauge)"""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                lines.append(f"{prefix}{name} {value}")
+
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{prefix}{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}{name}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{prefix}{name}_sum {histogram.sum}")
+                lines.append(f"{prefix}{name}_count {histogram.count}")
+
+            collectors = list(self._collectors)
+
+        for collect in collectors:
+            for name, value in sorted(collect().items()):
+                lines.append(f"# TYPE {prefix}{name} gauge")
+                lines.append(f"{prefix}{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def start_http_exporter(registry, port, host="0.0.0.0"):
+    """http://host:port/metrics 로 Prometheus가 긁어갈 수 있게 작은 HTTP 서버를 백그라운드로 띄웁니다."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass # 요청마다 터미널에 찍히지 않도록
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="yael-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,122 @@
+"""
+프로세스 전체에서 공유하는 GenerativeModel 풀.
+
+세션마다, 요약할 때마다 GenerativeModel을 새로 만들지 않고
+(모델 이름, 시스템 프롬프트, 안전 설정, 생성 설정)이 같으면 같은 객체를 재사용합니다.
+세션별로 다른 것은 대화 기록뿐이므로, 세션은 풀에서 받은 모델로 start_chat()만 따로 합니다.
+
+- 풀이 max_size를 넘으면 가장 오래 안 쓴 모델부터 버립니다. (LRU)
+- 안전 설정은 처음 모델을 만들 때 build_safety_settings()로 한 번만 만듭니다. (SDK import가 필요해서)
+- google.generativeai는 처음 모델을 만들 때 불러옵니다. (인트로 화면에서 import하지 않도록)
+- genai.configure()는 SDK의 클라이언트들을 초기화하므로 configure()로 키당 한 번만 부릅니다.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import scheduler
+
+WARM_UP_TEXT = "안녕하세요"
+
+
+def _load_genai():
+    import google.generativeai as genai
+    return genai
+
+
+class ModelPool:
+    def __init__(self, model_name, build_safety_settings, max_size=64):
+        self.model_name = model_name # 기본 모델 이름
+        self.max_size = max_size
+        self._build_safety_settings = build_safety_settings
+        self._lock = threading.Lock()
+        self._models = OrderedDict() # 설정 키 -> GenerativeModel (LRU 순서)
+        self._warmed = set()         # 연결 준비(count_tokens)까지 끝난 모델의 키
+        self._safety_settings = None
+        self._configure_lock = threading.Lock()
+        self._configured_key = None
+        self.created_count = 0
+        self.reused_count = 0
+
+    @property
+    def safety_settings(self):
+        with self._lock:
+            if self._safety_settings is None:
+                self._safety_settings = self._build_safety_settings()
+            return self._safety_settings
+
+    def configure(self, api_key):
+        """
+        API 키로 SDK를 설정합니다. 같은 키로는 프로세스당 한 번만 설정하고, 여러 스레드가 동시에 불러도 한 번만 실행됩니다.
+        (genai.configure는 만들어 둔 클라이언트를 모두 버리므로, 다른 세션이 쓰는 중에 다시 부르지 않도록)
+        """
+        with self._configure_lock:
+            if self._configured_key == api_key:
+                return
+            _load_genai().configure(api_key=api_key)
+            self._configured_key = api_key
+
+    def _key(self, model_name, instruction, generation_config):
+        instruction_hash = hashlib.sha256((instruction or "").encode("utf-8")).hexdigest()
+        safety_key = tuple(sorted((int(category), int(threshold)) for category, threshold in self.safety_settings.items()))
+        config_key = tuple(sorted((generation_config or {}).items()))
+        return (model_name or self.model_name, instruction_hash, safety_key, config_key)
+
+    def get(self, instruction=None, generation_config=None, model_name=None):
+        """설정에 맞는 모델을 돌려줍니다. 없으면 만들고, 풀이 가득 차면 가장 오래 안 쓴 모델을 버립니다."""
+        key = self._key(model_name, instruction, generation_config)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.reused_count += 1
+                return self._models[key]
+
+        # 모델 생성은 락 밖에서 (다른 스레드를 붙잡지 않도록)
+        model = _load_genai().GenerativeModel(
+            model_name=model_name or self.model_name,
+            system_instruction=instruction,
+            safety_settings=self.safety_settings,
+            generation_config=generation_config
+        )
+
+        with self._lock:
+            if key in self._models:
+                model = self._models[key] # 다른 스레드가 먼저 만들었으면 그것을 사용
+            else:
+                self._models[key] = model
+                self.created_count += 1
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_size:
+                evicted_key, _ = self._models.popitem(last=False)
+                self._warmed.discard(evicted_key)
+            return model
+
+    def warm_up(self, model, instruction=None, generation_config=None, model_name=None,
+                request_scheduler=None, session_id=None):
+        """
+        모델당 한 번만 가벼운 count_tokens 호출로 클라이언트 생성 + 연결/인증을 미리 끝내 둡니다.
+        request_scheduler를 주면 가장 낮은 우선순위로 스케줄러를 거쳐서 호출하고,
+        채팅에 쓸 한도가 빠듯하면(has_spare_budget()가 False) 호출하지 않고 넘어갑니다. (첫 요청에서 연결)
+        """
+        key = self._key(model_name, instruction, generation_config)
+        if request_scheduler is not None and not request_scheduler.has_spare_budget():
+            return
+        with self._lock:
+            if key in self._warmed:
+                return
+            self._warmed.add(key)
+        try:
+            if request_scheduler is None:
+                model.count_tokens(WARM_UP_TEXT)
+            else:
+                request_scheduler.submit(
+                    session_id,
+                    lambda: model.count_tokens(WARM_UP_TEXT),
+                    priority=scheduler.PRIORITY_WARMUP,
+                )
+        except Exception:
+            pass # 실패해도 첫 요청에서 다시 연결하므로 무시
+
+    def stats(self):
+        with self._lock:
+            return {"models": len(self._models), "created": self.created_count, "reused": self.reused_count}
@@ -0,0 +1,93 @@
+"""
+자주 반복되는 질문(메뉴 가격, "메뉴판 보여줘" 등)의 답변을 재사용하기 위한 응답 캐시.
+
+- 키: (정규화한 질문, 시스템 프롬프트+장기 기억의 해시, 앞선 대화의 해시, 모델 이름)
+  앞선 대화가 조금이라도 다르면 다른 키가 되므로, 다른 맥락의 답변을 재사용하지 않습니다.
+- LRU 방식으로 오래 안 쓴 항목부터 지우고, TTL이 지난 항목은 꺼낼 때 버립니다.
+- 항목 수(max_entries)와 전체 크기(max_bytes) 둘 다 넘지 않도록 유지합니다.
+- 답변은 제어 태그({{SHOW_MENU}} 등)를 포함한 원문 그대로 저장하므로, 재생할 때도 이미지가 나옵니다.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s.?!~,…ㅎㅋ]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    """공백/대소문자/끝의 문장부호 차이는 같은 질문으로 취급합니다. ("메뉴판 보여줘~" == "메뉴판  보여줘")"""
+    text = unicodedata.normalize("NFKC", prompt).lower().strip()
+    text = _TRAILING_PUNCTUATION.sub("", text)
+    return _WHITESPACE.sub(" ", text)
+
+
+def make_key(prompt, instruction, model_name, history=()):
+    """history: 이번 질문 앞의 대화 메시지들 ({"role", "content"} 목록, 대화 첫 질문이면 비어 있음)"""
+    instruction_hash = hashlib.sha256(instruction.encode("utf-8")).hexdigest()[:16]
+    history_hash = hashlib.sha256()
+    for message in history:
+        history_hash.update(f"{message['role']}\0{message['content']}\0".encode("utf-8"))
+    return (normalize_prompt(prompt), instruction_hash, history_hash.hexdigest()[:16], model_name)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, ttl=3600, max_bytes=2_000_000, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (저장 시각, 답변, 크기)
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """캐시된 답변을 돌려줍니다. 없거나 만료되었으면 None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] > self.ttl:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key) # 최근에 사용한 항목으로 표시
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, reply):
+        size = len(reply.encode("utf-8")) + sum(len(str(part)) for part in key)
+        if size > self.max_bytes:
+            return # 너무 큰 답변은 저장하지 않음
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.clock(), reply, size)
+            self._bytes += size
+
+            # 한도를 넘으면 가장 오래 안 쓴 항목부터 제거
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
@@ -0,0 +1,176 @@
+"""
+프로세스 전체에서 공유하는 API 요청 스케줄러.
+
+- 분당 요청 수(RPM)와 분당 토큰 수(TPM)를 토큰 버킷으로 관리해서, 한도를 넘기 전에 미리 줄을 세웁니다.
+- 대기 중인 요청은 우선순위(채팅 > 요약 > 연결 준비) -> 가장 오래 전에 처리된 세션 -> 먼저 온 순서로 처리합니다.
+  (한 세션이 연달아 보내도 다른 세션이 밀리지 않도록)
+- retry_on에 지정한 예외(예: 429 ResourceExhausted)가 나면 지터를 섞은 지수 백오프로 재시도하고,
+  그동안은 프로세스 전체의 요청을 잠시 멈춥니다.
+  (retry_on에 예외 클래스를 돌려주는 함수를 주면, 그 예외가 정의된 모듈의 import를 처음 예외가 날 때까지 미룹니다.)
+
+Gemini SDK에 의존하지 않으므로 가짜 백엔드(call 함수)로도 그대로 시험해 볼 수 있습니다.
+"""
+import itertools
+import random
+import threading
+import time
+
+PRIORITY_CHAT = 0     # 사용자가 기다리는 답변
+PRIORITY_SUMMARY = 1  # 백그라운드 요약 (채팅이 없을 때 처리)
+PRIORITY_WARMUP = 2   # 인트로 동안의 연결 준비 (가장 낮음)
+
+
+class _Ticket:
+    def __init__(self, session_id, tokens, priority, seq):
+        self.session_id = session_id
+        self.tokens = tokens
+        self.priority = priority
+        self.seq = seq
+        self.served_before = None # 처음 처리될 때의 "세션이 마지막으로 처리된 시각" (재시도 순서 유지용)
+
+
+class RequestScheduler:
+    def __init__(self, requests_per_minute, tokens_per_minute, retry_on=(), max_retries=5,
+                 base_delay=1.0, max_delay=30.0, clock=time.monotonic):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.retry_on = retry_on if callable(retry_on) else tuple(retry_on)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting = []
+        self._last_served = {}  # 세션 id -> 마지막으로 요청이 처리된 시각
+
+        # 토큰 버킷 (처음에는 가득 찬 상태로 시작)
+        self._request_budget = float(requests_per_minute)
+        self._token_budget = float(tokens_per_minute)
+        self._refilled_at = clock()
+        self._paused_until = 0.0 # 429를 받으면 이 시각까지 모든 요청을 멈춤
+
+        # 통계
+        self.granted_count = 0
+        self.retry_count = 0
+        self.rate_limited_count = 0
+
+    def submit(self, session_id, call, tokens=0, priority=PRIORITY_CHAT, on_wait=None, on_rate_limited=None):
+        """
+        예산이 허락할 때 call()을 실행하고 그 결과를 돌려줍니다.
+        tokens: 이 요청이 쓸 것으로 예상되는 토큰 수 (TPM 예산에서 차감)
+        on_wait(position, eta): 기다리는 동안 주기적으로 호출됩니다. (대기 순번, 예상 대기 시간(초))
+        on_rate_limited(attempt): retry_on 예외가 날 때마다 호출됩니다. (이 요청이 받은 429 횟수를 세는 용도)
+        retry_on 예외가 max_retries번을 넘게 나면 마지막 예외를 그대로 올려보냅니다.
+        """
+        ticket = _Ticket(session_id, min(tokens, self.tokens_per_minute), priority, next(self._seq))
+        attempt = 0
+        while True:
+            self._acquire(ticket, on_wait)
+            try:
+                return call()
+            except self._retryable():
+                attempt += 1
+                with self._cond:
+                    self.rate_limited_count += 1
+                if on_rate_limited is not None:
+                    on_rate_limited(attempt)
+                if attempt > self.max_retries:
+                    raise
+
+                # 지터를 섞은 지수 백오프: 절반은 고정, 절반은 무작위 (여러 세션이 동시에 재시도하지 않도록)
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                with self._cond:
+                    self.retry_count += 1
+                    self._paused_until = max(self._paused_until, self.clock() + delay)
+                    self._cond.notify_all()
+                # 재시도는 처음 줄을 섰을 때와 같은 순서 키(우선순위, 그때의 마지막 처리 시각, 순번)로
+                # 다시 줄을 서므로, 방금 처리된 것으로 기록된 세션이라도 뒤로 밀리지 않습니다.
+
+    def has_spare_budget(self, tokens=0, reserve_requests=1):
+        """
+        기다리는 요청이 없고, reserve_requests개를 채팅용으로 남겨도 지금 바로 보낼 수 있으면 True.
+        급하지 않은 요청(요약, 연결 준비)을 보낼지 말지 정할 때 씁니다. (스레드가 줄에서 기다리지 않도록)
+        """
+        with self._cond:
+            now = self.clock()
+            self._refill(now)
+            return (
+                not self._waiting
+                and now >= self._paused_until
+                and self._request_budget >= 1 + reserve_requests
+                and self._token_budget >= min(tokens, self.tokens_per_minute)
+            )
+
+    def stats(self):
+        with self._cond:
+            return {
+                "waiting": len(self._waiting),
+                "granted": self.granted_count,
+                "retries": self.retry_count,
+                "rate_limited": self.rate_limited_count,
+            }
+
+    # --- 내부 구현 ---
+    def _retryable(self):
+        return tuple(self.retry_on()) if callable(self.retry_on) else self.retry_on
+
+    def _refill(self, now):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._request_budget = min(self.requests_per_minute, self._request_budget + elapsed * self.requests_per_minute / 60)
+        self._token_budget = min(self.tokens_per_minute, self._token_budget + elapsed * self.tokens_per_minute / 60)
+
+    def _order(self, ticket):
+        if ticket.served_before is not None:
+            return (ticket.priority, ticket.served_before, ticket.seq) # 재시도
+        return (ticket.priority, self._last_served.get(ticket.session_id, 0.0), ticket.seq)
+
+    def _wait_for_budget(self, ticket, now):
+        """ticket 하나를 처리할 수 있을 때까지 남은 시간(초). 0이면 지금 바로 가능."""
+        wait = max(self._paused_until - now, 0.0)
+        if self._request_budget < 1:
+            wait = max(wait, (1 - self._request_budget) * 60 / self.requests_per_minute)
+        if self._token_budget < ticket.tokens:
+            wait = max(wait, (ticket.tokens - self._token_budget) * 60 / self.tokens_per_minute)
+        return wait
+
+    def _acquire(self, ticket, on_wait):
+        with self._cond:
+            self._waiting.append(ticket)
+
+        try:
+            while True:
+                with self._cond:
+                    now = self.clock()
+                    self._refill(now)
+                    queue = sorted(self._waiting, key=self._order)
+                    head_wait = self._wait_for_budget(queue[0], now)
+
+                    if queue[0] is ticket and head_wait == 0:
+                        self._request_budget -= 1
+                        self._token_budget -= ticket.tokens
+                        if ticket.served_before is None:
+                            ticket.served_before = self._last_served.get(ticket.session_id, 0.0)
+                        self._last_served[ticket.session_id] = now
+                        self._waiting.remove(ticket)
+                        self.granted_count += 1
+                        self._cond.notify_all()
+                        return
+
+                    position = queue.index(ticket) + 1
+                    # 앞사람들이 평균적으로 요청 1개씩 쓴다고 보고 대략적인 대기 시간 계산
+                    eta = head_wait + (position - 1) * 60 / self.requests_per_minute
+                    self._cond.wait(timeout=min(max(head_wait, 0.05), 1.0))
+
+                if on_wait is not None:
+                    on_wait(position, eta)
+        except BaseException:
+            # 대기 중에 스크립트가 중단되면 줄에서 빠짐
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+            raise
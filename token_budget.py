@@ -0,0 +1,55 @@
+"""
+토큰 예산 기반 컨텍스트 구성.
+
+매 턴 count_tokens API를 부르면 느리므로 글자 수로 토큰 수를 대충 추정하고,
+실제 응답의 usage_metadata.prompt_token_count로 보정 계수를 계속 맞춰갑니다. (TokenEstimator)
+build_context()는 최근 대화부터 거꾸로 담아서 입력 토큰 예산 안에 들어가는 만큼만 history로 만듭니다.
+
+- 보정 계수는 프로세스 전체에서 공유합니다. (앱에서는 cache_resource로 TokenEstimator 하나를 만들어 씀)
+- Streamlit 없이도 쓸 수 있어서 벤치마크(bench/context_bench.py)에서도 같은 추정기로 비교합니다.
+"""
+MESSAGE_TOKEN_OVERHEAD = 4 # 메시지 하나당 역할/구분자 등에 드는 토큰
+
+
+def estimate_raw_tokens(text):
+    """보정 전 추정치: 영문/숫자는 약 4글자당 1토큰, 한글 등은 글자당 약 0.6토큰"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other_chars = len(text) - ascii_chars
+    return ascii_chars / 4 + other_chars * 0.6
+
+
+class TokenEstimator:
+    def __init__(self, scale=1.0):
+        self.scale = scale # 보정 계수 (실제 토큰 수 / 추정 토큰 수)
+
+    def estimate(self, text):
+        return int(estimate_raw_tokens(text) * self.scale) + 1
+
+    def calibrate(self, raw_estimate, actual_tokens):
+        """실제 프롬프트 토큰 수로 보정 계수를 조금씩(지수 이동 평균) 갱신합니다."""
+        if raw_estimate <= 0 or not actual_tokens:
+            return
+        ratio = min(max(actual_tokens / raw_estimate, 0.3), 3.0) # 튀는 값 방지
+        self.scale = self.scale * 0.8 + ratio * 0.2
+
+
+def build_context(session_messages, budget, reserved_tokens, estimator):
+    """
+    최근 대화부터 거꾸로 담아서 토큰 예산(budget - reserved_tokens) 안에 들어가는 만큼만 history로 만듭니다.
+    reserved_tokens: 시스템 프롬프트 + 장기 기억 + 이번 메시지처럼 항상 들어가는 부분의 토큰 수
+    반환값: (formatted_history, window_start) - session_messages[:window_start]는 컨텍스트에서 빠진 대화
+    """
+    remaining = budget - reserved_tokens
+    window_start = len(session_messages)
+    for msg in reversed(session_messages):
+        cost = estimator.estimate(msg["content"]) + MESSAGE_TOKEN_OVERHEAD
+        if cost > remaining:
+            break
+        remaining -= cost
+        window_start -= 1
+
+    formatted_history = []
+    for msg in session_messages[window_start:]:
+        role = "model" if msg["role"] == "assistant" else "user"
+        formatted_history.append({"role": role, "parts": [msg["content"]]})
+    return formatted_history, window_start